@@ -6,35 +6,52 @@ import shutil
 import aiofiles
 from aiofiles import os as aios
 import numpy as np
+from PIL import Image
 from tensorflow.keras.applications.vgg16 import preprocess_input
 from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
 
 from src.utils.config_holder import get_config_holder
 from src.utils.file_util import get_file_util
-
+from src.utils.image_prefetcher import ImagePrefetcher, load_image_fast
+from src.utils.image_scanner import scan_images
+from src.utils.thumbnail_cache import create_thumbnail_cache
+
+
+def load_image_array(img_path, target_size, thumbnail_cache=None):
+    # 与 keras load_img 一致：按原尺寸解码后直接最近邻缩放。
+    # 不使用 draft/reduce 的快速缩小，它们会先做盒式滤波，得到与训练时不同的像素
+    if thumbnail_cache is not None:
+        # 从共享缩略图缓存读取，避免重复解码原图（像素与 keras 预处理不完全一致）
+        img = thumbnail_cache.get_thumbnail(img_path).resize(target_size, Image.NEAREST)
+    else:
+        img = load_image_fast(img_path).resize(target_size, Image.NEAREST)
+    return np.asarray(img, dtype=np.float32)
+
+def prepare_image_vgg16(img_path, thumbnail_cache=None):
+    img_array = load_image_array(img_path, (224, 224), thumbnail_cache)
+    return preprocess_input(img_array)  # 使用VGG16专用预处理
+
+def prepare_image_effnet(img_path, thumbnail_cache=None):
+    img_array = load_image_array(img_path, (300, 300), thumbnail_cache)  # 默认输入尺寸
+    return preprocess_input(img_array)  # EfficientNet专用预处理
+
+def prepare_image_resnet50(img_path, thumbnail_cache=None):
+    img_array = load_image_array(img_path, (224, 224), thumbnail_cache)
+    return img_array / 255.0  # 必须与训练相同的归一化
+
+def predict_prepared_image(model, img_array):
+    img_array = np.expand_dims(img_array, axis=0)
+    prediction = model.predict(img_array)
+    return prediction[0][0]  # 返回概率值
 
 def predict_image_vgg16(model, img_path):
-    img = image.load_img(img_path, target_size=(224, 224))
-    img_array = image.img_to_array(img)
-    img_array = preprocess_input(img_array)  # 使用VGG16专用预处理
-    img_array = np.expand_dims(img_array, axis=0)
-    return model.predict(img_array)[0][0]
+    return predict_prepared_image(model, prepare_image_vgg16(img_path))
 
 def predict_image_effnet(model, img_path):
-    img = image.load_img(img_path, target_size=(300, 300))  # 默认输入尺寸
-    img_array = image.img_to_array(img)
-    img_array = preprocess_input(img_array)  # EfficientNet专用预处理
-    img_array = np.expand_dims(img_array, axis=0)
-    return model.predict(img_array)[0][0]
+    return predict_prepared_image(model, prepare_image_effnet(img_path))
 
 def predict_image_resnet50(model, img_path):
-    img = image.load_img(img_path, target_size=(224, 224))
-    img_array = image.img_to_array(img)
-    img_array = img_array / 255.0  # 必须与训练相同的归一化
-    img_array = np.expand_dims(img_array, axis=0)
-    prediction = model.predict(img_array)
-    return prediction[0][0]  # 返回概率值
+    return predict_prepared_image(model, prepare_image_resnet50(img_path))
 
 
 async def async_copy(src, dst, chunk_size=128 * 1024):
@@ -63,6 +80,19 @@ class CNNFineTunedClassifier:
         print(self.images_path, self.output_negative, self.output_classified_path)
 
         self.image_pattern = config['common']['image_pattern']
+        self.recursive_scan = config['common'].get('recursive_scan', False)
+        # 预取：后台线程提前解码并缩放图像，与模型推理重叠
+        self.prefetch_workers = config['classifier'].get('prefetch_workers', 4)
+        self.prefetch_size = config['classifier'].get('prefetch_size', 32)
+        if "ResNet50" in self.model_name:
+            prepare_fn = prepare_image_resnet50
+        elif "EfficientNetB" in self.model_name:
+            prepare_fn = prepare_image_effnet
+        else:
+            prepare_fn = prepare_image_vgg16
+        # 与标签器共享的缩略图缓存
+        self.thumbnail_cache = create_thumbnail_cache(config['common'], fileutil)
+        self.prepare_image = lambda img_path: prepare_fn(img_path, self.thumbnail_cache)
         def clear_directory(directory):
             if os.path.exists(directory):
                 shutil.rmtree(directory)
@@ -70,20 +100,17 @@ class CNNFineTunedClassifier:
         clear_directory(self.output_classified_path)
         clear_directory(self.output_negative)
 
-    async def classify_single_file_async(self, item):
+    async def classify_single_file_async(self, item, img_array=None):
         item_path = os.path.join(self.images_path, item)
 
-        match = re.search(self.image_pattern, item)
+        match = re.search(self.image_pattern, item, re.IGNORECASE)
         if not match:
             return
 
         try:
-            if "ResNet50" in self.model_name:
-                prediction = predict_image_resnet50(self.model, item_path)
-            elif "EfficientNetB" in self.model_name:
-                prediction = predict_image_effnet(self.model, item_path)
-            else:
-                prediction = predict_image_vgg16(self.model, item_path)
+            if img_array is None:
+                img_array = self.prepare_image(item_path)
+            prediction = predict_prepared_image(self.model, img_array)
         except Exception as e:
             print(f"Error parsing {item_path}: {e}")
             return
@@ -92,18 +119,36 @@ class CNNFineTunedClassifier:
         dst = os.path.join(dst_dir, item)
 
         try:
-            os.makedirs(dst_dir, exist_ok=True)  # 用同步版本更稳
+            os.makedirs(os.path.dirname(dst), exist_ok=True)  # 用同步版本更稳；递归扫描时保留子目录结构
             await async_copy(item_path, dst)
             print(f"{'✅' if prediction > 0.5 else '❌'} {item_path} → {dst} (Score: {prediction:.4f})")
         except Exception as e:
             print(f"❌ 拷贝失败: {item_path} -> {dst}: {e}")
 
-    async def do_classify_async(self):
-        tasks = [self.classify_single_file_async(item) for item in os.listdir(self.images_path)]
+    async def do_classify_async(self, canonical_items=None):
+        # 流式扫描，边遍历目录边预取与推理；条目为相对 images_path 的路径
+        items = (image.relpath for image in scan_images(self.images_path, recursive=self.recursive_scan,
+                                                        extensions=None, pattern=self.image_pattern))
+        if canonical_items is not None:
+            # 只分类去重后保留的规范图片
+            canonical_items = set(canonical_items)
+            items = (item for item in items if item in canonical_items)
+        prefetcher = ImagePrefetcher(items, lambda item: self.prepare_image(os.path.join(self.images_path, item)),
+                                     num_workers=self.prefetch_workers, max_prefetch=self.prefetch_size)
+        tasks = []
+        for item, img_array, error in prefetcher:
+            if error is not None:
+                print(f"Error parsing {os.path.join(self.images_path, item)}: {error}")
+                continue
+            tasks.append(asyncio.create_task(self.classify_single_file_async(item, img_array)))
+            # 让出事件循环，使已完成推理的拷贝任务得以执行
+            await asyncio.sleep(0)
         await asyncio.gather(*tasks, return_exceptions=True)
+        if self.thumbnail_cache is not None:
+            self.thumbnail_cache.flush()
 
-    def do_classify(self):
-        asyncio.run(self.do_classify_async())
+    def do_classify(self, canonical_items=None):
+        asyncio.run(self.do_classify_async(canonical_items))
         print(f"所有执行完毕")
 
 
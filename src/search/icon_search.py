@@ -0,0 +1,180 @@
+"""
+图标相似度检索。
+
+为已标记的图标构建CLIP图像嵌入矩阵（float16 .npy，内存映射读取），
+支持以文本提示词或示例图片检索最相似的 top-k 图标，结果附带标签，供 folder-icon-management 导出使用。
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from src.tagger.clip_tagger import ClipTagger
+from src.utils.config_holder import get_config_holder
+from src.utils.embedding_index import top_k_indices
+from src.utils.file_util import get_file_util
+from src.utils.tag_store import load_tag_dict
+
+EMBEDDINGS_FILE = "embeddings.f16.npy"
+KEYS_FILE = "keys.json"
+META_FILE = "meta.json"
+
+
+class IconSearchIndex:
+    """
+    已标记图标的嵌入检索索引。
+
+    索引目录包含：
+    - embeddings.f16.npy：L2归一化的图像嵌入矩阵 (N, D)，float16 存储
+    - keys.json：与矩阵行对应的图片文件名
+    - meta.json：构建索引所用的模型，查询时校验模型一致
+    """
+
+    def __init__(self, config: dict, file_util, in_memory: bool = True):
+        """
+        :param config: 应用配置，读取 search、tagger.image_tag_dict_path 与 tagger.providers.clip
+        :param file_util: 文件工具
+        :param in_memory: 为True时加载后一次性转为 float32 常驻内存（查询最快）；
+                          为False时直接在内存映射上分块计算，内存占用最小
+        """
+        search_config = config.get('search', {})
+        self.config = config
+        self.file_util = file_util
+        self.index_dir = file_util.get_absolute_path(
+            search_config.get('index_dir', 'data/processed/search_index/'))
+        self.text_template = search_config.get('text_template', '{}')
+        self.chunk_size = search_config.get('chunk_size', 16384)
+        self.in_memory = in_memory
+        self.image_dir = file_util.get_absolute_path(
+            config['classifier'].get('classified_out_dir_positive', 'data/input'))
+        self.tag_dict_path = file_util.project_root + config['tagger']['image_tag_dict_path']
+
+        self.tagger = None
+        self.embeddings = None
+        self.keys = []
+        self.tags = {}
+
+    @property
+    def analyzer(self):
+        """按需加载的CLIP分析器，与CLIP标签器共用配置和图像嵌入缓存"""
+        if self.tagger is None:
+            self.tagger = ClipTagger(self.config)
+            self.tagger.load_model()
+        return self.tagger.analyzer
+
+    def build(self, batch_size: int = 16) -> int:
+        """
+        为标签结果中的全部图片计算嵌入并写出索引。
+
+        :param batch_size: 每批送入视觉编码器的图像数量
+        :return: 索引中的图片数量
+        """
+        tags = load_tag_dict(self.tag_dict_path)
+        # 标签结果的键是相对 image_dir 的路径（非递归扫描时即文件名）
+        tagged_paths = [os.path.join(self.image_dir, name) for name, image_tags in tags.items() if image_tags]
+        image_paths = [path for path in tagged_paths if os.path.exists(path)]
+        print(f"构建检索索引: {len(image_paths)} 个已标记图片")
+        if len(image_paths) < len(tagged_paths):
+            print(f"  {len(tagged_paths) - len(image_paths)} 个已标记图片在 {self.image_dir} 中不存在，已跳过")
+
+        keys, rows = [], []
+        for image_path, image_embeds, _ in self.analyzer.iter_image_embeddings(image_paths, batch_size):
+            keys.append(os.path.relpath(image_path, self.image_dir).replace(os.sep, '/'))
+            rows.append(image_embeds[0].cpu().numpy().astype(np.float16))
+        self.tagger.flush()
+        if not rows:
+            print("没有可索引的图片")
+            return 0
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        # 先写临时文件再改名，避免查询方读到不完整的索引；keys.json 最后写入
+        embeddings_path = os.path.join(self.index_dir, EMBEDDINGS_FILE)
+        with open(embeddings_path + '.tmp', 'wb') as file:
+            np.save(file, np.stack(rows))
+        os.replace(embeddings_path + '.tmp', embeddings_path)
+        for filename, data in ((META_FILE, {"model": self.analyzer.embedding_namespace(), "count": len(keys)}),
+                               (KEYS_FILE, keys)):
+            path = os.path.join(self.index_dir, filename)
+            with open(path + '.tmp', 'w') as file:
+                json.dump(data, file)
+            os.replace(path + '.tmp', path)
+        print(f"检索索引已写入: {self.index_dir}")
+        self.embeddings = None
+        return len(keys)
+
+    def load(self):
+        """加载索引与标签；索引由其他模型构建时抛出 ValueError"""
+        with open(os.path.join(self.index_dir, META_FILE), 'r') as file:
+            meta = json.load(file)
+        with open(os.path.join(self.index_dir, KEYS_FILE), 'r') as file:
+            self.keys = json.load(file)
+        if meta["model"] != self.analyzer.embedding_namespace():
+            raise ValueError(f"检索索引由模型 {meta['model']} 构建，与当前模型 "
+                             f"{self.analyzer.embedding_namespace()} 不一致，请重新构建索引")
+        embeddings = np.load(os.path.join(self.index_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        # numpy 的 float16 矩阵乘法没有BLAS加速，常驻内存时一次性转为 float32
+        self.embeddings = np.asarray(embeddings, dtype=np.float32) if self.in_memory else embeddings
+        self.tags = load_tag_dict(self.tag_dict_path)
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        """计算查询向量与全部图标的余弦相似度"""
+        if self.in_memory:
+            return self.embeddings @ query
+        scores = np.empty(len(self.keys), dtype=np.float32)
+        for start in range(0, len(self.keys), self.chunk_size):
+            chunk = np.asarray(self.embeddings[start:start + self.chunk_size], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ query
+        return scores
+
+    def search_by_vector(self, query: np.ndarray, k: int = 20) -> list:
+        """
+        以L2归一化的查询向量检索。
+
+        :param query: 形状为 (D,) 的查询向量
+        :param k: 返回的最大条数
+        :return: 按相似度降序排列的 {"file", "score", "tags"} 列表
+        """
+        if self.embeddings is None:
+            self.load()
+        scores = self._scores(np.asarray(query, dtype=np.float32).reshape(-1))
+        return [{"file": self.keys[row], "score": float(scores[row]), "tags": self.tags.get(self.keys[row], [])}
+                for row in top_k_indices(scores, k)]
+
+    def search_by_text(self, text: str, k: int = 20) -> list:
+        """以文本提示词检索图标"""
+        query = self.analyzer.encode_texts([self.text_template.format(text)])[0]
+        return self.search_by_vector(query.cpu().numpy(), k)
+
+    def search_by_image(self, image_path: str, k: int = 20) -> list:
+        """以示例图片检索相似图标（结果中包含示例图片本身，如果它已被索引）"""
+        for _, image_embeds, _ in self.analyzer.iter_image_embeddings([image_path], batch_size=1):
+            return self.search_by_vector(image_embeds[0].cpu().numpy(), k)
+        raise ValueError(f"无法计算示例图片的嵌入: {image_path}")
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+    file_util = get_file_util(project_root=project_root)
+    config_holder = get_config_holder(env='dev', config_dir=project_root + os.sep + "config")
+    app_config = config_holder.get_config('application')
+
+    parser = argparse.ArgumentParser(description='已标记图标的相似度检索')
+    parser.add_argument('--build', action='store_true', help='根据标签结果重新构建索引')
+    parser.add_argument('--text', type=str, help='文本提示词查询')
+    parser.add_argument('--image', type=str, help='示例图片查询')
+    parser.add_argument('--top-k', type=int, default=app_config.get('search', {}).get('top_k', 20))
+    parser.add_argument('--low-memory', action='store_true', help='在内存映射上分块计算，不转为float32常驻内存')
+    args = parser.parse_args()
+
+    index = IconSearchIndex(app_config, file_util, in_memory=not args.low_memory)
+    if args.build:
+        index.build(batch_size=app_config['tagger']['providers']['clip'].get('batch_size', 16))
+    if args.text or args.image:
+        index.load()
+        start = time.perf_counter()
+        hits = index.search_by_text(args.text, args.top_k) if args.text else index.search_by_image(args.image, args.top_k)
+        print(f"查询耗时: {(time.perf_counter() - start) * 1000:.1f}ms")
+        for hit in hits:
+            print(f"{hit['score']:.4f}  {hit['file']}  {', '.join(hit['tags'])}")
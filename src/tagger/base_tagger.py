@@ -1,13 +1,35 @@
 import abc
+import asyncio
+import os
 import time
 import re
 
+from src.utils.file_util import compute_file_hash
+from src.utils.rate_limiter import get_rate_limiter
+from src.utils.response_cache import get_response_cache
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+
+
+class ApiKeyUnavailableError(Exception):
+    """
+    API key暂时或永久不可用：鉴权失败（permanent=True），或限流重试次数耗尽（配额用尽）。
+    调度器据此隔离该key，并把请求交给其他key重试。
+    """
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
 class BaseTagger(metaclass=abc.ABCMeta):
     """
     基础标签类，定义了标签生成的基本方法。
     使用策略模式，子类将实现具体的标签生成策略。
     """
 
+    # 是否为本地模型标签器（本地推理、无API限额），本地标签器可使用多进程并行
+    runs_locally = False
+
     def __init__(self, config: dict):
         """
         初始化基础标签类。
@@ -17,6 +39,9 @@ class BaseTagger(metaclass=abc.ABCMeta):
         self.config = config['tagger']
         # tagger私有配置
         self.private_config = self.config['providers'][self.tagger_name()]
+        self._rate_limiter = None
+        self._response_cache = None
+        self._content_hashes = {}
 
     def load_model(self):
         """
@@ -24,6 +49,12 @@ class BaseTagger(metaclass=abc.ABCMeta):
         """
         pass
 
+    def flush(self):
+        """
+        将缓冲中的缓存数据写入磁盘。子类可以重写此方法。
+        """
+        pass
+
     @abc.abstractmethod
     def tagger_name(self):
         pass
@@ -50,6 +81,225 @@ class BaseTagger(metaclass=abc.ABCMeta):
         # 例如，可以在这里过滤掉置信度低于某个阈值的标签
         pass
 
+    def tag_images_batch(self, image_paths: list[str], batch_size: int = None) -> dict[str, list[str]]:
+        """
+        批量为多张图像生成标签。默认逐张调用 tag_image，支持批量推理的子类应重写此方法。
+
+        :param image_paths: 图像文件路径列表
+        :param batch_size: 每批处理的图像数量，为None时由子类使用其配置的默认值
+        :return: 图像路径到后处理标签的映射，格式与 postprocess_tags 的返回值一致；失败的图像不包含在结果中
+        """
+        results = {}
+        for image_path in image_paths:
+            try:
+                raw_tags = self._call_with_rate_limit(self.tag_image, image_path)
+                self._store_response(image_path, raw_tags)
+                results[image_path] = self.postprocess_tags(raw_tags)
+            except ApiKeyUnavailableError:
+                raise
+            except Exception as e:
+                print(f"标记图像失败 {image_path}: {str(e)}")
+        return results
+
+    async def tag_image_async(self, image_path: str) -> any:
+        """
+        tag_image 的协程版本。默认把同步的 tag_image 放到线程中执行，原生支持异步的子类应重写此方法。
+
+        :param image_path: 图像文件的路径
+        :return: 与 tag_image 相同的原始标签
+        """
+        return await asyncio.to_thread(self.tag_image, image_path)
+
+    async def tag_images_batch_async(self, image_paths: list[str], batch_size: int = None) -> dict[str, list[str]]:
+        """
+        tag_images_batch 的协程版本。默认逐张调用 tag_image_async。
+
+        :param image_paths: 图像文件路径列表
+        :param batch_size: 每批处理的图像数量
+        :return: 图像路径到后处理标签的映射；失败的图像不包含在结果中
+        """
+        results = {}
+        for image_path in image_paths:
+            try:
+                raw_tags = await self._call_with_rate_limit_async(self.tag_image_async, image_path)
+                self._store_response(image_path, raw_tags)
+                results[image_path] = self.postprocess_tags(raw_tags)
+            except ApiKeyUnavailableError:
+                raise
+            except Exception as e:
+                print(f"标记图像失败 {image_path}: {str(e)}")
+        return results
+
+    def response_cache_namespace(self):
+        """
+        响应缓存的命名空间，应包含影响响应内容的全部因素（如模型名与提示词哈希）。
+        默认返回None，即不使用响应缓存；调用远程API的子类应重写此方法。
+        """
+        return None
+
+    def _get_response_cache(self):
+        """按 tagger.response_cache 配置取得进程内共享的响应缓存，未启用时返回None"""
+        if self._response_cache is None:
+            cache_config = self.config.get('response_cache', {})
+            if not cache_config.get('enabled') or self.response_cache_namespace() is None:
+                self._response_cache = False
+            else:
+                cache_dir = cache_config.get('cache_dir', 'data/cache/responses/')
+                if not os.path.isabs(cache_dir):
+                    cache_dir = os.path.join(PROJECT_ROOT, cache_dir)
+                self._response_cache = get_response_cache(cache_dir)
+        return self._response_cache if self._response_cache is not False else None
+
+    def response_cache_stats(self):
+        """响应缓存（进程内共享）的命中/未命中计数，未启用缓存时返回None"""
+        cache = self._get_response_cache()
+        return dict(cache.stats) if cache is not None else None
+
+    def _response_cache_key(self, image_path: str) -> str:
+        """缓存键：图像内容哈希 + 命名空间，重命名或重新爬取的相同图片也能命中"""
+        content_hash = self._content_hashes.get(image_path)
+        if content_hash is None:
+            content_hash = compute_file_hash(image_path)
+            self._content_hashes[image_path] = content_hash
+        return f"{content_hash}:{self.response_cache_namespace()}"
+
+    def _cached_response(self, image_path: str):
+        """查询图片的缓存响应，未启用缓存或未命中时返回None"""
+        cache = self._get_response_cache()
+        if cache is None:
+            return None
+        return cache.get(self._response_cache_key(image_path))
+
+    def _store_response(self, image_path: str, raw_tags):
+        """将图片的原始响应写入缓存"""
+        cache = self._get_response_cache()
+        if cache is not None and raw_tags:
+            cache.put(self._response_cache_key(image_path), raw_tags)
+
+    def _split_cached(self, image_paths: list[str]):
+        """
+        将图片分为缓存命中与未命中两部分。
+
+        :return: (命中图片到后处理标签的映射, 未命中的图片路径列表)
+        """
+        cached_tags = {}
+        missing = []
+        for image_path in image_paths:
+            raw_tags = self._cached_response(image_path)
+            if raw_tags is None:
+                missing.append(image_path)
+            else:
+                cached_tags[image_path] = self.postprocess_tags(raw_tags)
+        return cached_tags, missing
+
+    def rate_limit_key(self) -> str:
+        """限流键，使用相同键的标签器实例共享同一个限流器。子类可按API key区分"""
+        return self.tagger_name()
+
+    def _get_rate_limiter(self):
+        """按 rpm / rpd 配置创建（或取得共享的）限流器，两者都未配置时返回None"""
+        if self._rate_limiter is None:
+            rpm = self.private_config.get('rpm')
+            rpd = self.private_config.get('rpd')
+            if not rpm and not rpd:
+                return None
+            self._rate_limiter = get_rate_limiter(self.rate_limit_key(), rpm=rpm, rpd=rpd)
+        return self._rate_limiter
+
+    @staticmethod
+    def _is_rate_limit_error(e: Exception) -> bool:
+        """是否为限流响应（HTTP 429 / RESOURCE_EXHAUSTED）"""
+        return getattr(e, 'code', None) == 429 or getattr(e, 'status', None) == 'RESOURCE_EXHAUSTED'
+
+    @staticmethod
+    def _is_auth_error(e: Exception) -> bool:
+        """是否为API key鉴权失败（key无效、被禁用或无权限）"""
+        return (getattr(e, 'code', None) in (401, 403)
+                or getattr(e, 'status', None) in ('UNAUTHENTICATED', 'PERMISSION_DENIED')
+                or 'API_KEY_INVALID' in str(e))
+
+    def _raise_for_key_error(self, e: Exception, attempt: int, max_retries: int):
+        """鉴权失败或限流重试耗尽时抛出 ApiKeyUnavailableError"""
+        if self._is_auth_error(e):
+            raise ApiKeyUnavailableError(f"API key鉴权失败: {str(e)[:100]}", permanent=True) from e
+        if self._is_rate_limit_error(e) and attempt >= max_retries:
+            raise ApiKeyUnavailableError(f"API key限流重试{max_retries}次后仍失败: {str(e)[:100]}") from e
+
+    def _call_with_rate_limit(self, fn, *args):
+        """
+        在限流器控制下调用API。
+
+        配置了 rpm / rpd 时，调用前只等待令牌所需的时间；收到429时按指数退避暂停该键的全部调用后重试，
+        最多重试 max_retries 次。未配置时回退为每次调用前按 wait_sec 固定等待，429 同样按指数退避后重试。
+        鉴权失败或重试耗尽时抛出 ApiKeyUnavailableError，由调度器隔离该key。
+
+        :param fn: 实际发出请求的函数
+        :param args: 传给 fn 的参数
+        :return: fn 的返回值
+        """
+        limiter = self._get_rate_limiter()
+        max_retries = self.private_config.get('max_retries', 5)
+        backoff_sec = self.private_config.get('backoff_sec', 10)
+        attempt = 0
+        while True:
+            if limiter is None:
+                self._wait_before_call()
+            else:
+                limiter.acquire()
+            try:
+                return fn(*args)
+            except Exception as e:
+                self._raise_for_key_error(e, attempt, max_retries)
+                if not self._is_rate_limit_error(e):
+                    raise
+                delay = min(backoff_sec * 2 ** attempt, 300)
+                print(f"  触发限流(429)，{delay}s 后重试: {str(e)[:100]}")
+                if limiter is None:
+                    time.sleep(delay)
+                else:
+                    limiter.penalize(delay)
+                attempt += 1
+
+    async def _call_with_rate_limit_async(self, coroutine_fn, *args):
+        """
+        _call_with_rate_limit 的协程版本，等待令牌与退避都不阻塞事件循环。
+
+        :param coroutine_fn: 实际发出请求的协程函数
+        :param args: 传给 coroutine_fn 的参数
+        :return: coroutine_fn 的返回值
+        """
+        limiter = self._get_rate_limiter()
+        wait_sec = self.private_config.get('wait_sec')
+        max_retries = self.private_config.get('max_retries', 5)
+        backoff_sec = self.private_config.get('backoff_sec', 10)
+        attempt = 0
+        while True:
+            if limiter is None:
+                if wait_sec is not None and wait_sec > 0:
+                    await asyncio.sleep(wait_sec)
+            else:
+                await limiter.acquire_async()
+            try:
+                return await coroutine_fn(*args)
+            except Exception as e:
+                self._raise_for_key_error(e, attempt, max_retries)
+                if not self._is_rate_limit_error(e):
+                    raise
+                delay = min(backoff_sec * 2 ** attempt, 300)
+                print(f"  触发限流(429)，{delay}s 后重试: {str(e)[:100]}")
+                if limiter is None:
+                    await asyncio.sleep(delay)
+                else:
+                    limiter.penalize(delay)
+                attempt += 1
+
+    def _wait_before_call(self):
+        """按 wait_sec 配置在每次调用前等待，防止超出API用量"""
+        if 'wait_sec' in self.private_config:
+            wait_sec = self.private_config['wait_sec']
+            if wait_sec is not None and wait_sec > 0:
+                time.sleep(wait_sec)
+
     ## 最终方法调用
     def final_process_image_tagging(self, image_abs_path: str) -> list[str]:
         """
@@ -58,12 +308,40 @@ class BaseTagger(metaclass=abc.ABCMeta):
         :param image_abs_path: 图像文件的路径
         :return: 预处理后的图像数据
         """
-        if 'wait_sec' in self.private_config:
-            wait_sec = self.private_config['wait_sec']
-            if wait_sec is not None and wait_sec > 0:
-                time.sleep(wait_sec)
-        final_tags = self.postprocess_tags(self.tag_image(image_abs_path))
-        return self.__tags_filter(final_tags)
+        # 命中响应缓存时不发起网络请求
+        raw_tags = self._cached_response(image_abs_path)
+        if raw_tags is None:
+            raw_tags = self._call_with_rate_limit(self.tag_image, image_abs_path)
+            self._store_response(image_abs_path, raw_tags)
+        return self.__tags_filter(self.postprocess_tags(raw_tags))
+
+    def final_process_images_batch(self, image_abs_paths: list[str], batch_size: int = None) -> dict[str, list[str]]:
+        """
+        批量版本的 final_process_image_tagging。
+
+        :param image_abs_paths: 图像文件路径列表
+        :param batch_size: 每批处理的图像数量，为None时使用标签器配置的默认值
+        :return: 图像路径到最终标签列表的映射
+        """
+        batch_tags, missing = self._split_cached(image_abs_paths)
+        if missing:
+            batch_tags.update(self.tag_images_batch(missing, batch_size=batch_size))
+        return {path: self.__tags_filter(tags) for path, tags in batch_tags.items()}
+
+    async def final_process_images_batch_async(self, image_abs_paths: list[str],
+                                               batch_size: int = None) -> dict[str, list[str]]:
+        """
+        final_process_images_batch 的协程版本。
+
+        :param image_abs_paths: 图像文件路径列表
+        :param batch_size: 每批处理的图像数量
+        :return: 图像路径到最终标签列表的映射
+        """
+        # 计算内容哈希需要读取整个文件，放到线程中执行，避免阻塞其他key的在途请求；哈希会被记住，写缓存时不再重复计算
+        batch_tags, missing = await asyncio.to_thread(self._split_cached, image_abs_paths)
+        if missing:
+            batch_tags.update(await self.tag_images_batch_async(missing, batch_size=batch_size))
+        return {path: self.__tags_filter(tags) for path, tags in batch_tags.items()}
 
     def __tags_filter(self, input_arr: list[str]) -> list[str]:
         # 去掉不希望看到的tag word
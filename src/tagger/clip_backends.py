@@ -0,0 +1,188 @@
+import inspect
+import os
+
+import torch
+
+
+def quantize_linear_layers(model):
+    """
+    对模型中的全部线性层做动态int8量化（权重int8，激活在运行时量化）。
+
+    Args:
+        model: PyTorch模型
+
+    Returns:
+        量化后的模型
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class ClipTorchBackend:
+    """
+    CLIP推理后端：直接使用PyTorch模型（eager模式）。
+    """
+
+    name = "torch"
+
+    def __init__(self, model, quantized: bool = False):
+        """
+        Args:
+            model: transformers的CLIP模型
+            quantized: 是否对线性层做动态int8量化
+        """
+        self.model = quantize_linear_layers(model) if quantized else model
+
+    def encode_images(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """编码预处理后的图像，返回未归一化的图像特征 (B, D)"""
+        with torch.no_grad():
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    def encode_texts(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        """编码分词后的文本，返回未归一化的文本特征 (N, D)"""
+        with torch.no_grad():
+            return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class _ImageEncoder(torch.nn.Module):
+    """导出ONNX用的视觉编码器包装"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _TextEncoder(torch.nn.Module):
+    """导出ONNX用的文本编码器包装"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class ClipOnnxBackend:
+    """
+    CLIP推理后端：将视觉和文本编码器导出为ONNX并使用ONNX Runtime在CPU上推理。
+
+    导出的模型缓存在 export_dir 下，只在首次使用时导出一次。
+    """
+
+    name = "onnx"
+
+    def __init__(self, model, export_dir: str, image_size: int = 224, opset_version: int = 14,
+                 quantized: bool = False):
+        """
+        Args:
+            model: transformers的CLIP模型，仅在需要导出时使用
+            export_dir: ONNX模型缓存目录（按模型区分）
+            image_size: 视觉编码器的输入尺寸
+            opset_version: ONNX opset版本
+            quantized: 是否使用动态int8量化后的ONNX模型
+        """
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("使用 onnx 后端需要安装 onnxruntime: pip install onnxruntime")
+
+        self.export_dir = export_dir
+        self.vision_path = os.path.join(export_dir, "vision_encoder.onnx")
+        self.text_path = os.path.join(export_dir, "text_encoder.onnx")
+        if not os.path.exists(self.vision_path) or not os.path.exists(self.text_path):
+            self._export(model, image_size, opset_version)
+        if quantized:
+            self.vision_path = self._quantize(self.vision_path)
+            self.text_path = self._quantize(self.text_path)
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 与torch保持一致的线程数，多进程模式下由工作进程初始化函数统一限制
+        session_options.intra_op_num_threads = torch.get_num_threads()
+        providers = ["CPUExecutionProvider"]
+        self.vision_session = onnxruntime.InferenceSession(self.vision_path, session_options, providers=providers)
+        self.text_session = onnxruntime.InferenceSession(self.text_path, session_options, providers=providers)
+
+    def _export(self, model, image_size, opset_version):
+        """导出视觉和文本编码器"""
+        print(f"导出CLIP ONNX模型到: {self.export_dir}")
+        os.makedirs(self.export_dir, exist_ok=True)
+        export_kwargs = {"opset_version": opset_version, "do_constant_folding": True}
+        # 新版torch默认使用dynamo导出，这里固定使用TorchScript导出以兼容动态维度配置
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            export_kwargs["dynamo"] = False
+
+        dummy_pixels = torch.zeros(1, 3, image_size, image_size)
+        dummy_ids = torch.ones(2, 8, dtype=torch.long)
+        dummy_mask = torch.ones(2, 8, dtype=torch.long)
+        with torch.no_grad():
+            # 先写入临时文件再改名，避免中断导出留下不完整的模型
+            torch.onnx.export(
+                _ImageEncoder(model), (dummy_pixels,), self.vision_path + ".tmp",
+                input_names=["pixel_values"], output_names=["image_embeds"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+                **export_kwargs
+            )
+            torch.onnx.export(
+                _TextEncoder(model), (dummy_ids, dummy_mask), self.text_path + ".tmp",
+                input_names=["input_ids", "attention_mask"], output_names=["text_embeds"],
+                dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                              "attention_mask": {0: "batch", 1: "sequence"},
+                              "text_embeds": {0: "batch"}},
+                **export_kwargs
+            )
+        os.replace(self.vision_path + ".tmp", self.vision_path)
+        os.replace(self.text_path + ".tmp", self.text_path)
+
+    @staticmethod
+    def _quantize(model_path: str) -> str:
+        """对ONNX模型做动态int8量化（结果缓存在同目录），返回量化模型路径"""
+        quantized_path = model_path.replace(".onnx", ".int8.onnx")
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            print(f"量化ONNX模型: {quantized_path}")
+            quantize_dynamic(model_path, quantized_path + ".tmp", weight_type=QuantType.QInt8)
+            os.replace(quantized_path + ".tmp", quantized_path)
+        return quantized_path
+
+    def encode_images(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """编码预处理后的图像，返回未归一化的图像特征 (B, D)"""
+        outputs = self.vision_session.run(None, {"pixel_values": pixel_values.numpy()})
+        return torch.from_numpy(outputs[0])
+
+    def encode_texts(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        """编码分词后的文本，返回未归一化的文本特征 (N, D)"""
+        outputs = self.text_session.run(None, {
+            "input_ids": input_ids.numpy().astype("int64"),
+            "attention_mask": attention_mask.numpy().astype("int64")
+        })
+        return torch.from_numpy(outputs[0])
+
+
+def create_clip_backend(backend_name: str, model, model_namespace: str, onnx_dir: str = None,
+                        image_size: int = 224, quantized: bool = False):
+    """
+    根据名称创建CLIP推理后端。
+
+    Args:
+        backend_name: 后端名称，"torch" 或 "onnx"
+        model: transformers的CLIP模型
+        model_namespace: 模型的目录安全名称，用于区分ONNX缓存
+        onnx_dir: ONNX模型缓存根目录
+        image_size: 视觉编码器的输入尺寸
+        quantized: 是否使用动态int8量化
+
+    Returns:
+        推理后端实例
+    """
+    if backend_name in (None, "", "torch"):
+        return ClipTorchBackend(model, quantized=quantized)
+    if backend_name == "onnx":
+        if not onnx_dir:
+            raise ValueError("onnx 后端需要配置 onnx_dir")
+        return ClipOnnxBackend(model, os.path.join(onnx_dir, model_namespace), image_size=image_size,
+                               quantized=quantized)
+    raise ValueError(f"未知的CLIP推理后端: {backend_name}")
@@ -0,0 +1,158 @@
+"""
+CLIP标签器量化精度对比工具。
+
+分别使用fp32与动态int8量化的 ClipAttributeAnalyzer 分析同一批样本图像，
+报告各属性标签的一致率、耗时与加速比，以及模型权重大小，用于决定是否在生产中启用 quantized。
+"""
+import argparse
+import io
+import os
+import random
+import time
+
+import torch
+from rich.console import Console
+from rich.table import Table
+
+from src.tagger.clip_tagger import ClipAttributeAnalyzer
+from src.utils.config_holder import get_config_holder
+from src.utils.file_util import get_file_util
+from src.utils.image_scanner import list_image_paths
+
+ATTRIBUTES = ["text", "subject", "color", "shape", "purpose"]
+
+
+def _jaccard(a: list, b: list) -> float:
+    """两个标签列表的Jaccard相似度，均为空时视为完全一致"""
+    set_a, set_b = set(a), set(b)
+    if not set_a and not set_b:
+        return 1.0
+    return len(set_a & set_b) / len(set_a | set_b)
+
+
+def _model_size_mb(model) -> float:
+    """序列化后的模型权重大小 (MB)，量化模型按打包后的int8权重计算"""
+    if model is None:
+        return 0.0
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1024 / 1024
+
+
+def _timed_analyze(analyzer: ClipAttributeAnalyzer, image_paths: list, batch_size: int):
+    """预热后分析全部图像，返回 (结果, 耗时秒数)"""
+    # 预热：加载BLIP、编码提示词嵌入，避免计入首次加载耗时
+    analyzer._ensure_blip_model()
+    analyzer.analyze_images(image_paths[:1], batch_size=1)
+    start = time.perf_counter()
+    results = analyzer.analyze_images(image_paths, batch_size=batch_size)
+    return results, time.perf_counter() - start
+
+
+def run_parity(image_paths: list, analyzer_kwargs: dict, batch_size: int = 16) -> dict:
+    """
+    对比fp32与int8分析器。
+
+    :param image_paths: 样本图像路径列表
+    :param analyzer_kwargs: ClipAttributeAnalyzer 的构造参数（不含 quantized 与 embedding_cache_dir）
+    :param batch_size: 每批送入视觉编码器的图像数量
+    :return: 对比报告字典
+    """
+    # 两个分析器都不使用嵌入缓存，保证int8分析器真正经过量化模型
+    fp32_analyzer = ClipAttributeAnalyzer(**analyzer_kwargs, quantized=False, embedding_cache_dir=None)
+    fp32_results, fp32_seconds = _timed_analyze(fp32_analyzer, image_paths, batch_size)
+    fp32_sizes = (_model_size_mb(fp32_analyzer.model), _model_size_mb(fp32_analyzer.blip_model))
+    del fp32_analyzer
+
+    int8_analyzer = ClipAttributeAnalyzer(**analyzer_kwargs, quantized=True, embedding_cache_dir=None)
+    int8_results, int8_seconds = _timed_analyze(int8_analyzer, image_paths, batch_size)
+    int8_sizes = (_model_size_mb(int8_analyzer.model), _model_size_mb(int8_analyzer.blip_model))
+    del int8_analyzer
+
+    common_paths = [path for path in image_paths if path in fp32_results and path in int8_results]
+    attribute_report = {}
+    for attribute in ATTRIBUTES + ["all"]:
+        exact = 0
+        jaccard_sum = 0.0
+        for path in common_paths:
+            if attribute == "all":
+                fp32_tags = [tag for attr in ATTRIBUTES for tag in fp32_results[path].get(attr, [])]
+                int8_tags = [tag for attr in ATTRIBUTES for tag in int8_results[path].get(attr, [])]
+            else:
+                fp32_tags = fp32_results[path].get(attribute, [])
+                int8_tags = int8_results[path].get(attribute, [])
+            exact += set(fp32_tags) == set(int8_tags)
+            jaccard_sum += _jaccard(fp32_tags, int8_tags)
+        count = max(len(common_paths), 1)
+        attribute_report[attribute] = {
+            "exact_match": exact / count,
+            "mean_jaccard": jaccard_sum / count
+        }
+
+    return {
+        "images": len(common_paths),
+        "attributes": attribute_report,
+        "fp32_seconds": fp32_seconds,
+        "int8_seconds": int8_seconds,
+        "speedup": fp32_seconds / int8_seconds if int8_seconds > 0 else 0.0,
+        "fp32_model_mb": fp32_sizes,
+        "int8_model_mb": int8_sizes
+    }
+
+
+def print_report(report: dict, console: Console = None):
+    """以表格形式打印对比报告"""
+    console = console or Console()
+    table = Table(title=f"fp32 vs int8 标签一致性 ({report['images']} 张图像)")
+    table.add_column("属性")
+    table.add_column("完全一致率", justify="right")
+    table.add_column("平均Jaccard", justify="right")
+    for attribute, stats in report["attributes"].items():
+        table.add_row(attribute, f"{stats['exact_match']:.1%}", f"{stats['mean_jaccard']:.3f}")
+    console.print(table)
+
+    console.print(f"fp32 耗时: {report['fp32_seconds']:.2f}s, int8 耗时: {report['int8_seconds']:.2f}s, "
+                  f"加速比: {report['speedup']:.2f}x")
+    console.print(f"CLIP权重: {report['fp32_model_mb'][0]:.1f}MB -> {report['int8_model_mb'][0]:.1f}MB, "
+                  f"BLIP权重: {report['fp32_model_mb'][1]:.1f}MB -> {report['int8_model_mb'][1]:.1f}MB")
+
+
+def _list_sample_images(image_dir: str, limit: int, seed: int) -> list:
+    """列出目录中的图像并随机抽样"""
+    image_paths = list_image_paths(image_dir)
+    if limit and len(image_paths) > limit:
+        image_paths = random.Random(seed).sample(image_paths, limit)
+    return image_paths
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+    file_util = get_file_util(project_root=project_root)
+    config_holder = get_config_holder(env='dev', config_dir=project_root + os.sep + "config")
+    clip_config = config_holder.get_value("application", "tagger.providers.clip", {})
+
+    parser = argparse.ArgumentParser(description='CLIP标签器 fp32/int8 精度对比')
+    parser.add_argument('--image-dir', type=str, help='样本图像目录，默认使用分类器的正例输出目录')
+    parser.add_argument('--limit', type=int, default=100, help='最多抽样的图像数量')
+    parser.add_argument('--seed', type=int, default=0, help='抽样随机种子')
+    parser.add_argument('--batch-size', type=int, default=clip_config.get('batch_size', 16))
+    args = parser.parse_args()
+
+    image_dir = args.image_dir or file_util.get_absolute_path(
+        config_holder.get_value("application", "classifier.classified_out_dir_positive"))
+    sample_paths = _list_sample_images(image_dir, args.limit, args.seed)
+    print(f"抽样 {len(sample_paths)} 张图像: {image_dir}")
+
+    onnx_dir = clip_config.get('onnx_dir')
+    parity_report = run_parity(sample_paths, {
+        "model_name": clip_config.get('model_name', "openai/clip-vit-base-patch32"),
+        "blip_model_name": clip_config.get('blip_model_name', "Salesforce/blip-image-captioning-base"),
+        "blip_num_beams": clip_config.get('blip_num_beams', 5),
+        "blip_max_length": clip_config.get('blip_max_length', 30),
+        "blip_greedy": clip_config.get('blip_greedy', False),
+        "text_gate": clip_config.get('text_gate', True),
+        "text_gate_threshold": clip_config.get('text_gate_threshold', 0.5),
+        "backend": clip_config.get('backend', 'torch'),
+        "onnx_dir": file_util.get_absolute_path(onnx_dir) if onnx_dir else None
+    }, batch_size=args.batch_size)
+    print_report(parity_report)
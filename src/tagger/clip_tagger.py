@@ -1,11 +1,19 @@
 import os
+import re
 from abc import ABC
+import numpy as np
 import torch
 from PIL import Image
 from transformers import AutoProcessor, AutoModelForZeroShotImageClassification
 from transformers import BlipProcessor, BlipForConditionalGeneration
 
 from src.tagger.base_tagger import BaseTagger
+from src.tagger.clip_backends import create_clip_backend, quantize_linear_layers
+from src.tagger.clip_text_bank import ClipTextEmbeddingBank, normalize_embeddings
+from src.utils.array_store import HashedArrayStore
+from src.utils.file_util import compute_file_hash, get_file_util
+from src.utils.image_prefetcher import ImagePrefetcher, load_image_fast
+from src.utils.thumbnail_cache import create_thumbnail_cache
 
 
 class ClipAttributeAnalyzer:
@@ -14,22 +22,72 @@ class ClipAttributeAnalyzer:
     """
 
     def __init__(self, model_name="openai/clip-vit-base-patch32",
-                 blip_model_name="Salesforce/blip-image-captioning-base"):
+                 blip_model_name="Salesforce/blip-image-captioning-base",
+                 blip_num_beams=5, blip_max_length=30, blip_greedy=False,
+                 text_gate=True, text_gate_threshold=0.5, embedding_cache_dir=None,
+                 backend="torch", onnx_dir=None, quantized=False, prefetch_workers=2, prefetch_size=32,
+                 thumbnail_cache=None):
         """
         初始化CLIP属性分析器。
         
         Args:
             model_name (str): CLIP模型的Hugging Face模型名称
             blip_model_name (str): BLIP模型的Hugging Face模型名称
+            blip_num_beams (int): BLIP文本检测的beam search宽度
+            blip_max_length (int): BLIP生成文本的最大长度（含提示词）
+            blip_greedy (bool): 为True时使用贪心解码，忽略 blip_num_beams
+            text_gate (bool): 是否先用CLIP判断图标是否含文字，不含文字时跳过BLIP
+            text_gate_threshold (float): 含文字概率达到该阈值才运行BLIP
+            embedding_cache_dir (str): 图像嵌入磁盘缓存目录，为None时不缓存
+            backend (str): CLIP推理后端，"torch"（默认）或 "onnx"
+            onnx_dir (str): onnx 后端导出模型的缓存目录
+            quantized (bool): 是否对CLIP和BLIP的线性层做动态int8量化
+            prefetch_workers (int): 预取解码图像的后台线程数
+            prefetch_size (int): 最多提前准备的图像数量
+            thumbnail_cache (ThumbnailCache): 与分类器共享的缩略图缓存，为None时直接解码原图
         """
         print(f"加载CLIP模型: {model_name}")
         self.processor = AutoProcessor.from_pretrained(model_name)
         self.model = AutoModelForZeroShotImageClassification.from_pretrained(model_name)
+        self.model_name = model_name
+        self.quantized = quantized
+        self.logit_scale = self.model.logit_scale.exp().item()
+        self.backend = create_clip_backend(backend, self.model, self.model_namespace(), onnx_dir=onnx_dir,
+                                           image_size=self.model.config.vision_config.image_size,
+                                           quantized=quantized)
+        # 只保留后端实际使用的模型（量化副本或ONNX会话），释放多余的fp32权重
+        self.model = getattr(self.backend, "model", None)
+
+        # 图像预取：后台线程解码并预处理，解码尺寸不低于CLIP与BLIP(384)的输入尺寸
+        self.prefetch_workers = prefetch_workers
+        self.prefetch_size = prefetch_size
+        self.decode_size = max(self.processor.image_processor.crop_size["height"], 384)
+        self.thumbnail_cache = thumbnail_cache
 
         # 初始化BLIP模型（懒加载，只在需要时加载）
         self.blip_processor = None
         self.blip_model = None
         self.blip_model_name = blip_model_name
+        self.blip_num_beams = blip_num_beams
+        self.blip_max_length = blip_max_length
+        self.blip_greedy = blip_greedy
+
+        # 引导BLIP关注图标文本的提示词
+        self.blip_text_prompts = [
+            "a folder icon with text that says",
+            "the text on this icon reads",
+            "this icon contains the text"
+        ]
+        # 提示词input_ids缓存
+        self._blip_prompt_ids = None
+
+        # 文字存在性预检：基于已有的CLIP图像嵌入做零样本二分类，决定是否运行BLIP
+        self.text_gate = text_gate
+        self.text_gate_threshold = text_gate_threshold
+        self.text_presence_prompts = [
+            "a folder icon with text or letters on it",
+            "a folder icon without any text or letters"
+        ]
 
         # 定义各种属性的候选标签
         self.attribute_candidates = {
@@ -113,12 +171,221 @@ class ClipAttributeAnalyzer:
         # 定义通用主题提示
         self.general_subject_prompt = "This image contains {}"
 
+        # 通用主题的一级类别
+        self.general_categories = [
+            "flower", "animal", "vehicle", "food", "building",
+            "landscape", "person", "furniture", "technology", "art",
+            "nature", "object", "symbol", "plant", "tool"
+        ]
+
+        # 一级类别对应的具体子类别
+        self.specific_subcategories = {
+            "flower": ["rose", "tulip", "sunflower", "daisy", "lily", "orchid", "poppy", "lotus"],
+            "animal": ["dog", "cat", "bird", "fish", "lion", "tiger", "elephant", "bear", "horse"],
+            "vehicle": ["car", "bus", "truck", "bicycle", "motorcycle", "train", "airplane", "ship"],
+            "food": ["apple", "pizza", "cake", "coffee", "bread", "sandwich", "salad", "burger"],
+            "technology": ["computer", "phone", "laptop", "camera", "headphones", "speaker", "tablet"],
+            "symbol": ["heart", "star", "arrow", "check", "cross", "question", "exclamation"]
+        }
+
+        # 各属性保留的最大结果数量与最低概率阈值
+        self.attribute_top_k = {
+            "subject": 3,
+            "color": 3,
+            "shape": 3,
+            "purpose": 3
+        }
+        self.attribute_thresholds = {
+            "subject": 0.1,
+            "color": 0.1,
+            "shape": 0.1,
+            "purpose": 0.1,
+            "general": 0.15,
+            "general_sub": 0.15,
+            "color_combination": 0.2
+        }
+
+        # 文本嵌入库：固定提示词只编码一次，大提示词组分块编码以控制内存
+        self.text_bank = ClipTextEmbeddingBank(self.encode_texts)
+
+        # 颜色组合候选（颜色对索引与提示词）缓存
+        self._color_combination_cache = None
+
+        # 图像嵌入磁盘缓存：以图像内容哈希为键，按模型分目录存放
+        self.embedding_cache = None
+        self.embedding_cache_stats = {"hits": 0, "misses": 0}
+        if embedding_cache_dir:
+            self.embedding_cache = HashedArrayStore(
+                os.path.join(embedding_cache_dir, self.embedding_namespace()))
+
+    def model_namespace(self):
+        """模型名称的目录安全形式"""
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', self.model_name)
+
+    def embedding_namespace(self):
+        """图像嵌入缓存的命名空间，不同模型（及量化后的模型）、由缩略图或原图计算的嵌入互不混用"""
+        namespace = self.model_namespace()
+        if self.quantized:
+            namespace = f"{namespace}-int8-{self.backend.name}"
+        if self.thumbnail_cache is not None:
+            namespace = f"{namespace}-{self.thumbnail_cache.namespace()}"
+        return namespace
+
+    def encode_texts(self, texts):
+        """
+        使用CLIP文本编码器编码提示词。
+
+        Args:
+            texts: 提示词列表
+
+        Returns:
+            L2归一化后的文本嵌入矩阵 (N, D)
+        """
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True)
+        text_embeds = self.backend.encode_texts(inputs.input_ids, inputs.attention_mask)
+        return normalize_embeddings(text_embeds)
+
+    def encode_images(self, images):
+        """
+        使用CLIP视觉编码器编码图像。
+
+        Args:
+            images: PIL图像对象或其列表
+
+        Returns:
+            L2归一化后的图像嵌入矩阵 (B, D)
+        """
+        inputs = self.processor(images=images, return_tensors="pt")
+        return self.encode_pixel_values(inputs.pixel_values)
+
+    def encode_pixel_values(self, pixel_values):
+        """
+        编码已预处理的图像张量。
+
+        Args:
+            pixel_values: 处理器输出的图像张量 (B, 3, H, W)
+
+        Returns:
+            L2归一化后的图像嵌入矩阵 (B, D)
+        """
+        return normalize_embeddings(self.backend.encode_images(pixel_values))
+
+    def _score_texts(self, image, bank_name, texts, image_embeds=None):
+        """
+        计算图像与一组提示词的匹配概率，与CLIP的logits_per_image.softmax等价。
+
+        Args:
+            image: PIL图像对象
+            bank_name: 文本嵌入库中的提示词组名称
+            texts: 提示词列表
+            image_embeds: 预先计算的图像嵌入 (1, D)，为None时现场编码图像
+
+        Returns:
+            长度为 len(texts) 的概率向量
+        """
+        if image_embeds is None:
+            image_embeds = self.encode_images(image)
+        text_embeds = self.text_bank.get(bank_name, texts)
+        with torch.no_grad():
+            logits = self.logit_scale * image_embeds @ text_embeds.t()
+        return logits.softmax(dim=-1)[0]
+
+    def _color_combination_candidates(self):
+        """
+        构建（并缓存）颜色组合候选：有序颜色对及其对应的提示词文本。
+
+        Returns:
+            (颜色索引对列表, 提示词列表)，提示词按 组合 × 模板 的顺序排列
+        """
+        cache_key = (tuple(self.attribute_candidates["color"]), tuple(self.color_combination_prompts))
+        if self._color_combination_cache is None or self._color_combination_cache[0] != cache_key:
+            colors = self.attribute_candidates["color"]
+            color_pairs = []
+            combination_texts = []
+            for i, color1 in enumerate(colors):
+                for j, color2 in enumerate(colors):
+                    if i != j:
+                        color_pairs.append((i, j))
+                        # 对每种提示模板创建一个查询
+                        for prompt in self.color_combination_prompts:
+                            combination_texts.append(prompt.format(color1, color2))
+            self._color_combination_cache = (cache_key, color_pairs, combination_texts)
+        return self._color_combination_cache[1], self._color_combination_cache[2]
+
     def _ensure_blip_model(self):
         """确保BLIP模型已加载"""
         if self.blip_processor is None or self.blip_model is None:
             print(f"加载BLIP模型: {self.blip_model_name}")
             self.blip_processor = BlipProcessor.from_pretrained(self.blip_model_name)
             self.blip_model = BlipForConditionalGeneration.from_pretrained(self.blip_model_name)
+            if self.quantized:
+                self.blip_model = quantize_linear_layers(self.blip_model)
+
+    def score_text_presence(self, image, image_embeds=None):
+        """
+        估计图标上含有文字的概率。复用CLIP图像嵌入，开销只有一次二分类矩阵乘法。
+
+        Args:
+            image: PIL图像对象
+            image_embeds: 预先计算的图像嵌入，为None时现场编码图像
+
+        Returns:
+            含文字的概率 (0~1)
+        """
+        probs = self._score_texts(image, "text_presence", self.text_presence_prompts, image_embeds)
+        return float(probs[0])
+
+    def _get_blip_prompt_ids(self):
+        """
+        将文本提示词分词（结果缓存）。
+
+        BLIP解码器使用绝对位置编码，且generate会去掉末尾的[SEP]，不等长的提示词无法填充后放在同一批中生成，
+        因此每个提示词单独generate，只共享图像的预处理与视觉编码。
+
+        Returns:
+            [(提示词, input_ids张量(1, L))] 列表
+        """
+        if self._blip_prompt_ids is None:
+            token_ids = self.blip_processor.tokenizer(self.blip_text_prompts).input_ids
+            self._blip_prompt_ids = [(prompt, torch.tensor([ids], dtype=torch.long))
+                                     for prompt, ids in zip(self.blip_text_prompts, token_ids)]
+        return self._blip_prompt_ids
+
+    def _generate_blip_texts(self, image):
+        """
+        对图像只做一次预处理和一次视觉编码，再用每个提示词分别运行BLIP文本解码器。
+
+        Args:
+            image: PIL图像对象
+
+        Returns:
+            [(提示词, 生成文本)] 列表
+        """
+        pixel_values = self.blip_processor(images=image, return_tensors="pt").pixel_values
+        text_config = self.blip_model.config.text_config
+        if self.blip_greedy:
+            decode_kwargs = {"num_beams": 1}
+        else:
+            decode_kwargs = {"num_beams": self.blip_num_beams, "early_stopping": True}
+
+        generated = []
+        with torch.no_grad():
+            image_embeds = self.blip_model.vision_model(pixel_values=pixel_values)[0]
+            for prompt, input_ids in self._get_blip_prompt_ids():
+                input_ids = input_ids.clone()
+                # 与 BlipForConditionalGeneration.generate 一致：以BOS开头并去掉末尾的[SEP]
+                input_ids[:, 0] = text_config.bos_token_id
+                outputs = self.blip_model.text_decoder.generate(
+                    input_ids=input_ids[:, :-1],
+                    eos_token_id=text_config.sep_token_id,
+                    pad_token_id=text_config.pad_token_id,
+                    encoder_hidden_states=image_embeds,
+                    encoder_attention_mask=torch.ones(image_embeds.shape[:-1], dtype=torch.long),
+                    max_length=self.blip_max_length,
+                    **decode_kwargs
+                )
+                generated.append((prompt, self.blip_processor.decode(outputs[0], skip_special_tokens=True)))
+        return generated
 
     def detect_text_with_blip(self, image):
         """
@@ -134,46 +401,18 @@ class ClipAttributeAnalyzer:
             # 确保BLIP模型已加载
             self._ensure_blip_model()
 
-            # 处理图像
-            inputs = self.blip_processor(image, return_tensors="pt")
+            results = []
+            for prompt, generated_text in self._generate_blip_texts(image):
+                # 处理生成的文本
+                # 移除提示词部分
+                if prompt in generated_text:
+                    clean_text = generated_text.replace(prompt, "").strip()
+                else:
+                    clean_text = generated_text.strip()
 
-            # 生成描述
-            with torch.no_grad():
-                # 使用不同的提示来引导模型关注文本
-                text_prompts = [
-                    "a folder icon with text that says",
-                    "the text on this icon reads",
-                    "this icon contains the text"
-                ]
-
-                results = []
-                for prompt in text_prompts:
-                    # 添加提示词引导模型
-                    inputs["input_ids"] = self.blip_processor(
-                        images=image,
-                        text=prompt,
-                        return_tensors="pt"
-                    ).input_ids
-
-                    # 生成文本
-                    outputs = self.blip_model.generate(
-                        **inputs,
-                        max_length=30,
-                        num_beams=5,
-                        early_stopping=True
-                    )
-                    generated_text = self.blip_processor.decode(outputs[0], skip_special_tokens=True)
-
-                    # 处理生成的文本
-                    # 移除提示词部分
-                    if prompt in generated_text:
-                        clean_text = generated_text.replace(prompt, "").strip()
-                    else:
-                        clean_text = generated_text.strip()
-
-                    # 检查是否有有效文本
-                    if clean_text and len(clean_text) > 1:
-                        results.append(clean_text)
+                # 检查是否有有效文本
+                if clean_text and len(clean_text) > 1:
+                    results.append(clean_text)
 
             # 处理结果以提取实际文本
             if results:
@@ -205,13 +444,14 @@ class ClipAttributeAnalyzer:
             print(f"使用BLIP检测文本失败: {e}")
             return []
 
-    def analyze_attribute(self, image, attribute_type):
+    def analyze_attribute(self, image, attribute_type, image_embeds=None):
         """
         分析图像的特定属性。
         
         Args:
             image: PIL图像对象
             attribute_type: 属性类型("subject", "color", "shape", "purpose")
+            image_embeds: 预先计算的图像嵌入，为None时现场编码图像
             
         Returns:
             检测到的属性值列表
@@ -230,33 +470,23 @@ class ClipAttributeAnalyzer:
         # 格式化候选文本
         candidate_texts = [prompt_template.format(label) for label in candidate_labels]
 
-        # 准备CLIP模型的输入
-        inputs = self.processor(
-            text=candidate_texts,
-            images=image,
-            return_tensors="pt",
-            padding=True
-        )
+        # 文本嵌入来自嵌入库，只需编码图像
+        probs = self._score_texts(image, attribute_type, candidate_texts, image_embeds)
 
-        # 运行推理
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            logits_per_image = outputs.logits_per_image
-            probs = logits_per_image.softmax(dim=1)
-
-        # 获取前3个预测结果
-        top_count = min(3, len(candidate_labels))
-        top_probs, top_indices = torch.topk(probs[0], k=top_count)
+        # 获取前k个预测结果
+        top_count = min(self.attribute_top_k.get(attribute_type, 3), len(candidate_labels))
+        threshold = self.attribute_thresholds.get(attribute_type, 0.1)
+        top_probs, top_indices = torch.topk(probs, k=top_count)
 
         # 格式化结果
         results = []
         for i, (prob, idx) in enumerate(zip(top_probs, top_indices)):
-            if prob > 0.1:  # 只包含概率显著的结果
+            if prob > threshold:  # 只包含概率显著的结果
                 results.append(candidate_labels[idx])
 
         return results
 
-    def analyze_general_subject(self, image):
+    def analyze_general_subject(self, image, image_embeds=None):
         """
         使用更通用的方法分析图像中的主题。
         这允许CLIP更灵活地识别图像中的主要对象，
@@ -264,51 +494,30 @@ class ClipAttributeAnalyzer:
         
         Args:
             image: PIL图像对象
+            image_embeds: 预先计算的图像嵌入，为None时现场编码图像
             
         Returns:
             检测到的主题列表
         """
         # 使用通用主题提示和CLIP的零样本能力
         # 这里我们查询一些更通用的类别
-        general_categories = [
-            "flower", "animal", "vehicle", "food", "building",
-            "landscape", "person", "furniture", "technology", "art",
-            "nature", "object", "symbol", "plant", "tool"
-        ]
+        general_categories = self.general_categories
 
         candidate_texts = [self.general_subject_prompt.format(cat) for cat in general_categories]
-
-        # 准备CLIP模型的输入
-        inputs = self.processor(
-            text=candidate_texts,
-            images=image,
-            return_tensors="pt",
-            padding=True
-        )
-
-        # 运行推理
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            logits_per_image = outputs.logits_per_image
-            probs = logits_per_image.softmax(dim=1)
+        if image_embeds is None:
+            image_embeds = self.encode_images(image)
+        probs = self._score_texts(image, "general", candidate_texts, image_embeds)
 
         # 获取最匹配的一般类别
-        top_prob, top_idx = torch.topk(probs[0], k=1)
+        top_prob, top_idx = torch.topk(probs, k=1)
         top_category = general_categories[top_idx]
 
         # 如果概率太低，直接返回空
-        if top_prob < 0.15:
+        if top_prob < self.attribute_thresholds["general"]:
             return []
 
         # 根据顶级类别，使用更具体的子类别
-        specific_subcategories = {
-            "flower": ["rose", "tulip", "sunflower", "daisy", "lily", "orchid", "poppy", "lotus"],
-            "animal": ["dog", "cat", "bird", "fish", "lion", "tiger", "elephant", "bear", "horse"],
-            "vehicle": ["car", "bus", "truck", "bicycle", "motorcycle", "train", "airplane", "ship"],
-            "food": ["apple", "pizza", "cake", "coffee", "bread", "sandwich", "salad", "burger"],
-            "technology": ["computer", "phone", "laptop", "camera", "headphones", "speaker", "tablet"],
-            "symbol": ["heart", "star", "arrow", "check", "cross", "question", "exclamation"]
-        }
+        specific_subcategories = self.specific_subcategories
 
         # 如果没有子类别，就返回通用类别
         if top_category not in specific_subcategories:
@@ -317,37 +526,25 @@ class ClipAttributeAnalyzer:
         # 查询具体子类别
         subcategories = specific_subcategories[top_category]
         sub_candidates = [self.general_subject_prompt.format(sub) for sub in subcategories]
-
-        # 准备CLIP模型的输入
-        sub_inputs = self.processor(
-            text=sub_candidates,
-            images=image,
-            return_tensors="pt",
-            padding=True
-        )
-
-        # 运行推理
-        with torch.no_grad():
-            sub_outputs = self.model(**sub_inputs)
-            sub_logits = sub_outputs.logits_per_image
-            sub_probs = sub_logits.softmax(dim=1)
+        sub_probs = self._score_texts(image, f"general:{top_category}", sub_candidates, image_embeds)
 
         # 获取最匹配的子类别
-        sub_top_prob, sub_top_idx = torch.topk(sub_probs[0], k=1)
+        sub_top_prob, sub_top_idx = torch.topk(sub_probs, k=1)
 
         # 如果子类别概率太低，就使用通用类别
-        if sub_top_prob < 0.15:
+        if sub_top_prob < self.attribute_thresholds["general_sub"]:
             return [top_category]
 
         # 返回最匹配的子类别
         return [subcategories[sub_top_idx]]
 
-    def analyze_color_combinations(self, image):
+    def analyze_color_combinations(self, image, image_embeds=None):
         """
         分析图像中的颜色组合。专门处理多色图标。
         
         Args:
             image: PIL图像对象
+            image_embeds: 预先计算的图像嵌入，为None时现场编码图像
             
         Returns:
             检测到的颜色列表，可能包含多个颜色
@@ -355,48 +552,28 @@ class ClipAttributeAnalyzer:
         colors = self.attribute_candidates["color"]
 
         # 首先获取最有可能的几个单色
-        single_color_results = self.analyze_attribute(image, "color")
+        if image_embeds is None:
+            image_embeds = self.encode_images(image)
+        single_color_results = self.analyze_attribute(image, "color", image_embeds)
 
         # 如果只检测到一种或没有颜色，直接返回
         if len(single_color_results) <= 1:
             return single_color_results
 
-        # 检测颜色组合
-        # 从检测到的单色中选择前两个进行组合测试
-        top_colors = single_color_results[:2]
-
-        # 为每种组合创建候选文本
-        combination_texts = []
-        for color1 in colors:
-            for color2 in colors:
-                if color1 != color2:
-                    # 对每种提示模板创建一个查询
-                    for prompt in self.color_combination_prompts:
-                        combination_texts.append(prompt.format(color1, color2))
-
-        # 准备CLIP模型的输入
-        inputs = self.processor(
-            text=combination_texts,
-            images=image,
-            return_tensors="pt",
-            padding=True
-        )
-
-        # 运行推理
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            logits_per_image = outputs.logits_per_image
-            probs = logits_per_image.softmax(dim=1)
+        # 检测颜色组合：组合文本嵌入矩阵预先计算，一次相似度运算即可选出最佳组合
+        color_pairs, combination_texts = self._color_combination_candidates()
+        probs = self._score_texts(image, "color_combination", combination_texts, image_embeds)
 
-        # 获取最佳组合
-        top_prob, top_idx = torch.topk(probs[0], k=1)
-        best_combination = combination_texts[top_idx]
+        # 获取最佳组合（文本按 组合 × 模板 排列）
+        top_prob, top_idx = torch.max(probs, dim=0)
+        best_pair = color_pairs[int(top_idx) // len(self.color_combination_prompts)]
 
         # 如果组合的置信度显著高于单色（相对值大于1.5倍），则增强颜色列表
-        if top_prob > 0.2:
-            # 从最佳组合文本中提取颜色
-            for color in colors:
-                if color not in single_color_results and color in best_combination:
+        if top_prob > self.attribute_thresholds["color_combination"]:
+            # 按候选颜色顺序加入最佳组合中的新颜色
+            for color_idx in sorted(best_pair):
+                color = colors[color_idx]
+                if color not in single_color_results:
                     single_color_results.append(color)
 
             # 确保不超过三种颜色
@@ -405,6 +582,14 @@ class ClipAttributeAnalyzer:
 
         return single_color_results
 
+    def _open_image(self, image_path):
+        """打开图像并转换为RGB，失败时返回None"""
+        try:
+            return Image.open(image_path).convert("RGB")
+        except Exception as e:
+            print(f"打开图像失败: {e}")
+            return None
+
     def analyze_image(self, image_path):
         """
         分析图像的多个属性。
@@ -415,23 +600,146 @@ class ClipAttributeAnalyzer:
         Returns:
             包含检测到的属性的字典
         """
-        # 打开图像
+        # 单次前向：图像只经过一次视觉编码器（或直接命中嵌入缓存），所有属性共享同一嵌入
+        return self.analyze_images([image_path], batch_size=1).get(image_path, {})
+
+    def analyze_images(self, image_paths, batch_size=16):
+        """
+        批量分析多张图像。图像由后台线程预取解码，按批一次性送入视觉编码器。
+
+        Args:
+            image_paths: 图像文件路径列表
+            batch_size: 每批送入视觉编码器的图像数量
+
+        Returns:
+            图像路径到属性字典的映射，打开或编码失败的图像不包含在结果中
+        """
+        results = {}
+        for image_path, image_embeds, image in self.iter_image_embeddings(image_paths, batch_size=batch_size):
+            results[image_path] = self.analyze_image_embeds(image, image_embeds, image_path=image_path)
+        return results
+
+    def embed_images(self, image_paths, batch_size=16):
+        """
+        计算图像嵌入。优先读取磁盘嵌入缓存，未命中的图像按批解码、编码并写回缓存。
+
+        Args:
+            image_paths: 图像文件路径列表
+            batch_size: 每批送入视觉编码器的图像数量
+
+        Returns:
+            (图像路径到嵌入(1, D)的映射, 图像路径到本次解码的PIL图像的映射)，失败的图像不包含在内
+        """
+        embeddings = {}
+        images = {}
+        for image_path, image_embeds, image in self.iter_image_embeddings(image_paths, batch_size=batch_size):
+            embeddings[image_path] = image_embeds
+            if image is not None:
+                images[image_path] = image
+        return embeddings, images
+
+    def iter_image_embeddings(self, image_paths, batch_size=16):
+        """
+        流式计算图像嵌入。读取、哈希、解码与预处理在后台线程中预取，
+        与主线程的模型推理重叠；缓存命中的图像不解码，未命中的图像凑满一批后一次编码。
+
+        Args:
+            image_paths: 图像文件路径列表
+            batch_size: 每批送入视觉编码器的图像数量
+
+        Yields:
+            (图像路径, 嵌入(1, D), 已解码的PIL图像或None)
+        """
+        prefetcher = ImagePrefetcher(image_paths, self._prepare_image, num_workers=self.prefetch_workers,
+                                     max_prefetch=max(self.prefetch_size, batch_size))
+        pending = []
+        for image_path, prepared, error in prefetcher:
+            if error is not None:
+                print(f"打开图像失败 {image_path}: {error}")
+                continue
+            content_hash, cached, image, pixel_values = prepared
+            if cached is not None:
+                self.embedding_cache_stats["hits"] += 1
+                yield image_path, torch.from_numpy(cached).unsqueeze(0), None
+                continue
+            if self.embedding_cache is not None:
+                self.embedding_cache_stats["misses"] += 1
+            pending.append((image_path, content_hash, image, pixel_values))
+            if len(pending) >= batch_size:
+                yield from self._encode_pending_images(pending)
+                pending = []
+        if pending:
+            yield from self._encode_pending_images(pending)
+
+    def _prepare_image(self, image_path):
+        """
+        预取阶段（后台线程）：计算内容哈希并查询嵌入缓存，未命中时解码并预处理图像。
+
+        Returns:
+            (内容哈希, 缓存的嵌入或None, PIL图像或None, 预处理后的图像张量或None)
+        """
+        content_hash = None
+        if self.embedding_cache is not None or self.thumbnail_cache is not None:
+            content_hash = compute_file_hash(image_path)
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(content_hash)
+            if cached is not None:
+                return content_hash, cached, None, None
+        if self.thumbnail_cache is not None:
+            # 从共享缩略图缓存读取；BLIP需要时再按需打开原图
+            thumbnail = self.thumbnail_cache.get_thumbnail(image_path, content_hash)
+            pixel_values = self.processor(images=thumbnail, return_tensors="pt").pixel_values[0]
+            return content_hash, None, None, pixel_values
+        # 解码尺寸兼顾CLIP与BLIP(384)的输入，超大图像在解码阶段就被快速缩小
+        image = load_image_fast(image_path, target_size=(self.decode_size, self.decode_size))
+        pixel_values = self.processor(images=image, return_tensors="pt").pixel_values[0]
+        return content_hash, None, image, pixel_values
+
+    def _encode_pending_images(self, pending):
+        """编码一批已预处理的图像，写入嵌入缓存并逐个产出"""
         try:
-            image = Image.open(image_path).convert("RGB")
+            batch_embeds = self.encode_pixel_values(torch.stack([item[3] for item in pending]))
         except Exception as e:
-            print(f"打开图像失败: {e}")
-            return {}
+            print(f"批量编码图像失败: {e}")
+            return
+        for i, (image_path, content_hash, image, _) in enumerate(pending):
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(content_hash, batch_embeds[i].cpu().numpy().astype(np.float32))
+            yield image_path, batch_embeds[i:i + 1], image
+
+    def analyze_image_embeds(self, image, image_embeds, image_path=None):
+        """
+        基于已计算的图像嵌入分析图像的多个属性。
 
+        Args:
+            image: PIL图像对象（用于BLIP文本检测），为None时按需从 image_path 打开
+            image_embeds: 图像嵌入 (1, D)
+            image_path: 图像文件路径
+
+        Returns:
+            包含检测到的属性的字典
+        """
         # 分析不同属性
         results = {}
 
         # 首先检测文本 - 这可能是图标中最明显的特征
-        results["text"] = self.detect_text_with_blip(image)
+        # 大多数图标没有文字，先用CLIP预检，只有可能含文字时才运行代价高昂的BLIP
+        run_blip = True
+        if self.text_gate:
+            try:
+                text_score = self.score_text_presence(image, image_embeds)
+                run_blip = text_score >= self.text_gate_threshold
+                results["text_gate"] = {"score": round(text_score, 4), "run_blip": run_blip}
+            except Exception as e:
+                print(f"文字预检失败: {e}")
+        if run_blip and image is None:
+            image = self._open_image(image_path)
+        results["text"] = self.detect_text_with_blip(image) if run_blip and image is not None else []
 
         # 然后分析形状和用途
         for attr_type in ["shape", "purpose"]:
             try:
-                attr_results = self.analyze_attribute(image, attr_type)
+                attr_results = self.analyze_attribute(image, attr_type, image_embeds)
                 results[attr_type] = attr_results
             except Exception as e:
                 print(f"分析属性 {attr_type} 失败: {e}")
@@ -439,7 +747,7 @@ class ClipAttributeAnalyzer:
 
         # 使用增强的颜色分析
         try:
-            results["color"] = self.analyze_color_combinations(image)
+            results["color"] = self.analyze_color_combinations(image, image_embeds)
         except Exception as e:
             print(f"分析颜色失败: {e}")
             results["color"] = []
@@ -447,10 +755,10 @@ class ClipAttributeAnalyzer:
         # 最后用两种方法分析主题，并合并结果
         try:
             # 使用预定义候选项
-            subject_results = self.analyze_attribute(image, "subject")
+            subject_results = self.analyze_attribute(image, "subject", image_embeds)
 
             # 使用通用主题分析
-            general_results = self.analyze_general_subject(image)
+            general_results = self.analyze_general_subject(image, image_embeds)
 
             # 合并结果，去除重复
             results["subject"] = list(set(subject_results + general_results))
@@ -466,6 +774,8 @@ class ClipTagger(BaseTagger, ABC):
     使用CLIP模型进行图像标记的标记器实现。
     """
 
+    runs_locally = True
+
     def __init__(self, config: dict):
         """
         初始化CLIP标记器。
@@ -475,15 +785,52 @@ class ClipTagger(BaseTagger, ABC):
         """
         super().__init__(config)
         self.analyzer = None
+        self.file_util = get_file_util(
+            project_root=os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+        # 公共配置（缩略图缓存等与分类器共享的设置）
+        self.common_config = config.get('common', {})
 
     def tagger_name(self):
         return "clip"
 
+    def load_model(self):
+        self._ensure_analyzer()
+
+    def flush(self):
+        if self.analyzer is None:
+            return
+        if self.analyzer.embedding_cache is not None:
+            self.analyzer.embedding_cache.flush()
+        if self.analyzer.thumbnail_cache is not None:
+            self.analyzer.thumbnail_cache.flush()
+
     def _ensure_analyzer(self):
         """确保初始化分析器"""
         if self.analyzer is None:
             model_name = self.private_config.get('model_name', "openai/clip-vit-base-patch32")
-            self.analyzer = ClipAttributeAnalyzer(model_name=model_name)
+            blip_model_name = self.private_config.get('blip_model_name', "Salesforce/blip-image-captioning-base")
+            self.analyzer = ClipAttributeAnalyzer(
+                model_name=model_name,
+                blip_model_name=blip_model_name,
+                blip_num_beams=self.private_config.get('blip_num_beams', 5),
+                blip_max_length=self.private_config.get('blip_max_length', 30),
+                blip_greedy=self.private_config.get('blip_greedy', False),
+                text_gate=self.private_config.get('text_gate', True),
+                text_gate_threshold=self.private_config.get('text_gate_threshold', 0.5),
+                embedding_cache_dir=self._resolve_cache_dir('embedding_cache_dir'),
+                backend=self.private_config.get('backend', 'torch'),
+                onnx_dir=self._resolve_cache_dir('onnx_dir'),
+                quantized=self.private_config.get('quantized', False),
+                prefetch_workers=self.private_config.get('prefetch_workers', 2),
+                thumbnail_cache=create_thumbnail_cache(self.common_config, self.file_util)
+            )
+
+    def _resolve_cache_dir(self, key):
+        """读取目录配置，相对路径视为相对于项目根目录"""
+        cache_dir = self.private_config.get(key)
+        if not cache_dir:
+            return None
+        return self.file_util.get_absolute_path(cache_dir)
 
     def tag_image(self, image_path: str) -> dict:
         """
@@ -502,6 +849,25 @@ class ClipTagger(BaseTagger, ABC):
 
         return attributes
 
+    def tag_images_batch(self, image_paths: list, batch_size: int = None) -> dict:
+        """
+        批量为多张图像生成标签，图像按批送入CLIP视觉编码器。
+
+        Args:
+            image_paths: 图像文件路径列表
+            batch_size: 每批处理的图像数量，为None时读取配置 batch_size
+
+        Returns:
+            图像路径到后处理标签列表的映射
+        """
+        self._ensure_analyzer()
+        if batch_size is None:
+            batch_size = self.private_config.get('batch_size', 16)
+
+        print(f"使用CLIP批量分析 {len(image_paths)} 张图像, batch_size={batch_size}")
+        batch_attributes = self.analyzer.analyze_images(image_paths, batch_size=batch_size)
+        return {path: self.postprocess_tags(attributes) for path, attributes in batch_attributes.items()}
+
     def postprocess_tags(self, raw_tags: dict) -> list:
         """
         后处理标签。
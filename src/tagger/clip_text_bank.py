@@ -0,0 +1,74 @@
+import threading
+
+import torch
+
+
+class ClipTextEmbeddingBank:
+    """
+    CLIP文本嵌入库。
+
+    每组固定提示词只经过一次CLIP文本编码器，之后常驻内存复用L2归一化的嵌入矩阵，
+    图像只需与该矩阵做一次矩阵乘法即可得到全部候选的相似度。
+    """
+
+    def __init__(self, encode_fn, chunk_size=256):
+        """
+        初始化文本嵌入库。
+
+        Args:
+            encode_fn: 文本编码函数，输入字符串列表，返回L2归一化后的嵌入矩阵 (N, D)
+            chunk_size: 每次送入文本编码器的最大提示词数量，避免一次性构造超大的填充张量
+        """
+        self._encode_fn = encode_fn
+        self._chunk_size = chunk_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, texts):
+        """
+        获取一组提示词的嵌入矩阵，首次访问时编码并缓存。
+
+        Args:
+            name: 提示词组名称，例如 "color"
+            texts: 提示词列表
+
+        Returns:
+            形状为 (len(texts), D) 的归一化嵌入矩阵
+        """
+        texts = tuple(texts)
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == texts:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(name)
+            # 候选词被修改后需要重新编码
+            if entry is None or entry[0] != texts:
+                embeddings = self._encode_chunked(list(texts))
+                entry = (texts, embeddings)
+                self._entries[name] = entry
+        return entry[1]
+
+    def _encode_chunked(self, texts):
+        """分块编码提示词并拼接为一个矩阵"""
+        if len(texts) <= self._chunk_size:
+            return self._encode_fn(texts)
+        chunks = [self._encode_fn(texts[i:i + self._chunk_size])
+                  for i in range(0, len(texts), self._chunk_size)]
+        return torch.cat(chunks, dim=0).contiguous()
+
+    def clear(self):
+        """清空所有已缓存的嵌入"""
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def normalize_embeddings(embeddings: torch.Tensor) -> torch.Tensor:
+    """对嵌入矩阵按行做L2归一化"""
+    return embeddings / embeddings.norm(dim=-1, keepdim=True)
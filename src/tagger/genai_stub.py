@@ -0,0 +1,276 @@
+"""
+genai 客户端的本地替身，用于在不消耗真实配额的情况下压测与调优标签调度。
+
+- StubGenaiClient：进程内模拟的客户端，可配置延迟、错误率、按key的服务端RPM限制（超出返回429）与鉴权失败的key，
+  响应可以是根据图片内容确定性生成的关键词，也可以回放录制的真实响应；
+- RecordingGenaiClient：包装真实客户端，把每次请求的响应录制到 JSONL 文件，供回放使用；
+- create_genai_client：按 google_ai.client_mode 配置创建 live / record / replay / fake 客户端。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from google import genai
+from google.genai import errors, types
+
+# 模拟响应使用的关键词
+_STUB_COLORS = ["blue", "red", "green", "yellow", "purple", "orange", "black", "white", "pink", "gray"]
+_STUB_SUBJECTS = ["music", "document", "photo", "video", "download", "book", "code", "cloud", "game", "mail"]
+_STUB_USES = ["application", "workspace", "database", "themes", "sdk", "note", "pdf", "audiobook"]
+
+
+def request_key(model: str, contents: list) -> str:
+    """
+    请求内容的哈希，用于录制与回放匹配。文本按原文、内联图片按字节内容计算，
+    因此同一张图片以相同提示词和模型请求时得到相同的键。
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(model.encode('utf-8'))
+    for item in contents:
+        if isinstance(item, str):
+            digest.update(item.encode('utf-8'))
+        elif getattr(item, 'inline_data', None) is not None:
+            digest.update(hashlib.blake2b(item.inline_data.data, digest_size=20).digest())
+        else:
+            digest.update(str(getattr(item, 'uri', None) or getattr(item, 'name', None) or item).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ReplayStore:
+    """请求键到响应文本的录制文件（JSONL，追加写入）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.responses = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.responses[record["key"]] = record["text"]
+
+    def get(self, key: str):
+        return self.responses.get(key)
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self.responses[key] = text
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps({"key": key, "text": text}, ensure_ascii=False) + "\n")
+
+
+class StubStats:
+    """模拟服务端的全局统计，供压测工具读取"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.accepted = 0
+            self.rate_limited = 0
+            self.auth_failed = 0
+            self.server_errors = 0
+            self.replay_hits = 0
+            self.replay_misses = 0
+            self.latencies = []
+
+    def record(self, field: str, latency: float = None):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            if latency is not None:
+                self.latencies.append(latency)
+
+
+stub_stats = StubStats()
+
+# 模拟服务端按key记录的请求时间窗口，所有客户端实例共享
+_server_windows = {}
+_server_lock = threading.Lock()
+
+
+class _StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _StubFile:
+    """模拟 files.upload 的返回值，携带文件内容以便生成确定性的响应"""
+
+    def __init__(self, file, config=None):
+        mime_type = getattr(config, 'mime_type', None) or 'application/octet-stream'
+        if isinstance(file, (str, os.PathLike)):
+            self.name = os.path.basename(file)
+            with open(file, 'rb') as f:
+                data = f.read()
+        else:
+            self.name = "upload"
+            data = file.read()
+        self.inline_data = types.Blob(data=data, mime_type=mime_type)
+
+
+class _Models:
+    """client.models / client.aio.models 的替身，转发给所属客户端的生成函数"""
+
+    def __init__(self, generate_fn):
+        self._generate_fn = generate_fn
+
+    def generate_content(self, model, contents, config=None):
+        return self._generate_fn(model, contents, config)
+
+
+class _Files:
+    """client.files 的替身，上传时只读取本地文件内容"""
+
+    def upload(self, file, config=None):
+        return _StubFile(file, config)
+
+
+class _AsyncFiles:
+    async def upload(self, file, config=None):
+        return _StubFile(file, config)
+
+
+class _Aio:
+    def __init__(self, models, files):
+        self.models = models
+        self.files = files
+
+
+class StubGenaiClient:
+    """进程内模拟的 genai 客户端，同时提供同步接口与 aio 异步接口"""
+
+    def __init__(self, api_key: str, stub_config: dict = None, replay: ReplayStore = None):
+        """
+        :param api_key: API key，用于服务端RPM限制与鉴权失败模拟
+        :param stub_config: 模拟参数：latency_ms、latency_jitter_ms、error_rate、rpm_limit、auth_fail_keys、seed
+        :param replay: 录制的响应，命中时返回录制内容，未命中时返回模拟内容
+        """
+        stub_config = stub_config or {}
+        self.api_key = api_key
+        self.latency_sec = stub_config.get('latency_ms', 800) / 1000
+        self.jitter_sec = stub_config.get('latency_jitter_ms', 300) / 1000
+        self.error_rate = stub_config.get('error_rate', 0.0)
+        self.rpm_limit = stub_config.get('rpm_limit')
+        self.auth_fail_keys = set(stub_config.get('auth_fail_keys', []))
+        self.replay = replay
+        self._random = random.Random(stub_config.get('seed'))
+        self.models = _Models(self._generate)
+        self.files = _Files()
+        self.aio = _Aio(_Models(self._generate_async), _AsyncFiles())
+
+    def _latency(self) -> float:
+        return max(0.0, self._random.gauss(self.latency_sec, self.jitter_sec))
+
+    def _check_server(self):
+        """模拟服务端的鉴权、RPM限制与随机错误"""
+        if self.api_key in self.auth_fail_keys:
+            stub_stats.record('auth_failed')
+            raise errors.ClientError(403, {"error": {"code": 403, "message": "API key not valid. API_KEY_INVALID",
+                                                     "status": "PERMISSION_DENIED"}})
+        if self.rpm_limit:
+            with _server_lock:
+                window = _server_windows.setdefault(self.api_key, deque())
+                now = time.monotonic()
+                while window and now - window[0] >= 60:
+                    window.popleft()
+                if len(window) >= self.rpm_limit:
+                    stub_stats.record('rate_limited')
+                    raise errors.ClientError(429, {"error": {"code": 429, "message": "Resource has been exhausted",
+                                                             "status": "RESOURCE_EXHAUSTED"}})
+                window.append(now)
+        if self._random.random() < self.error_rate:
+            stub_stats.record('server_errors')
+            raise errors.ServerError(503, {"error": {"code": 503, "message": "The model is overloaded",
+                                                     "status": "UNAVAILABLE"}})
+
+    def _respond(self, model: str, contents: list, config) -> _StubResponse:
+        if self.replay is not None:
+            text = self.replay.get(request_key(model, contents))
+            if text is not None:
+                stub_stats.record('replay_hits')
+                return _StubResponse(text)
+            stub_stats.record('replay_misses')
+        images = [item for item in contents if getattr(item, 'inline_data', None) is not None]
+        keywords = [self._synthetic_keywords(image.inline_data.data) for image in images]
+        if config is not None and getattr(config, 'response_mime_type', None) == "application/json":
+            return _StubResponse(json.dumps({str(i): words for i, words in enumerate(keywords)}))
+        return _StubResponse(keywords[0] if keywords else "")
+
+    @staticmethod
+    def _synthetic_keywords(data: bytes) -> str:
+        """根据图片内容确定性地生成关键词"""
+        seed = hashlib.blake2b(data, digest_size=8).digest()
+        return ", ".join([_STUB_COLORS[seed[0] % len(_STUB_COLORS)], _STUB_COLORS[seed[1] % len(_STUB_COLORS)],
+                          _STUB_SUBJECTS[seed[2] % len(_STUB_SUBJECTS)], _STUB_USES[seed[3] % len(_STUB_USES)],
+                          _STUB_USES[seed[4] % len(_STUB_USES)], "smooth", "rounded"])
+
+    def _generate(self, model, contents, config=None):
+        latency = self._latency()
+        time.sleep(latency)
+        self._check_server()
+        stub_stats.record('accepted', latency)
+        return self._respond(model, contents, config)
+
+    async def _generate_async(self, model, contents, config=None):
+        latency = self._latency()
+        await asyncio.sleep(latency)
+        self._check_server()
+        stub_stats.record('accepted', latency)
+        return self._respond(model, contents, config)
+
+
+class RecordingGenaiClient:
+    """包装真实客户端，录制每次 generate_content 的响应文本"""
+
+    def __init__(self, client: genai.Client, store: ReplayStore):
+        self.client = client
+        self.store = store
+        self.models = _Models(self._generate)
+        self.files = client.files
+        self.aio = _Aio(_Models(self._generate_async), client.aio.files)
+
+    def _generate(self, model, contents, config=None):
+        response = self.client.models.generate_content(model=model, contents=contents, config=config)
+        self.store.put(request_key(model, contents), response.text)
+        return response
+
+    async def _generate_async(self, model, contents, config=None):
+        response = await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+        self.store.put(request_key(model, contents), response.text)
+        return response
+
+
+def create_genai_client(api_key: str, private_config: dict, project_root: str):
+    """
+    按 client_mode 创建客户端。
+
+    :param api_key: API key
+    :param private_config: tagger.providers.google_ai 配置
+    :param project_root: 项目根目录，用于解析相对的录制文件路径
+    :return: live 模式返回 genai.Client，其余模式返回行为兼容的替身
+    """
+    mode = private_config.get('client_mode', 'live')
+    if mode == 'live':
+        return genai.Client(api_key=api_key)
+
+    record_path = private_config.get('record_path', 'data/cache/genai_recordings.jsonl')
+    if not os.path.isabs(record_path):
+        record_path = os.path.join(project_root, record_path)
+    if mode == 'record':
+        return RecordingGenaiClient(genai.Client(api_key=api_key), ReplayStore(record_path))
+    if mode == 'replay':
+        return StubGenaiClient(api_key, private_config.get('stub'), replay=ReplayStore(record_path))
+    if mode == 'fake':
+        return StubGenaiClient(api_key, private_config.get('stub'))
+    raise ValueError(f"未知的 client_mode: {mode}")
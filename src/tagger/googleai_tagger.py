@@ -1,8 +1,24 @@
+import asyncio
+import hashlib
+import io
+import json
+import mimetypes
 from abc import ABC
 
 from google import genai
+from google.genai import types
 
-from src.tagger.base_tagger import BaseTagger
+from src.tagger.base_tagger import PROJECT_ROOT, BaseTagger
+from src.tagger.genai_stub import create_genai_client
+from src.utils.upload_transform import get_upload_transform
+
+# 批量模式下附加在公共提示词之后的说明，要求按图标序号返回JSON
+BATCH_PROMPT_TEMPLATE = (
+    "You will receive {count} icons, each preceded by its label \"Icon <index>:\" (index 0 to {last}). "
+    "Analyze every icon independently using the instructions above. "
+    "Return a JSON object whose keys are the icon indexes as strings (\"0\" to \"{last}\") "
+    "and whose values are the comma separated keywords for that icon."
+)
 
 
 class GoogleAITagger(BaseTagger, ABC):
@@ -15,23 +31,189 @@ class GoogleAITagger(BaseTagger, ABC):
             self.api_key = api_key_list[0]
         self.model = self.private_config['model']
         self.prompt = self.config['common_tagging_prompt']
+        # 不超过该大小的图片以内联字节发送，更大的图片才走文件上传
+        self.inline_max_bytes = int(self.private_config.get('inline_max_mb', 15) * 1024 * 1024)
+        # 每次请求打包的图标数量，1 表示逐张请求
+        self.batch_size = max(1, self.private_config.get('batch_size', 1))
+        # 上传前的缩小与重新编码，未启用时发送原始文件
+        self.upload_transform = get_upload_transform(self.private_config.get('upload_transform'))
+        self._client = None
 
     def tagger_name(self):
         return "google_ai"
 
+    def response_cache_namespace(self):
+        # 模型或提示词变化后缓存自然失效
+        prompt_hash = hashlib.blake2b(self.prompt.encode('utf-8'), digest_size=8).hexdigest()
+        if self.upload_transform is not None:
+            return f"{self.model}:{prompt_hash}:{self.upload_transform.signature()}"
+        return f"{self.model}:{prompt_hash}"
+
+    def rate_limit_key(self) -> str:
+        # 配额按API key计算，使用同一个key的线程共享限流器
+        return f"{self.tagger_name()}:{self.api_key}"
+
+    @property
+    def client(self) -> genai.Client:
+        """标签器生命周期内复用同一个客户端（及其连接池），首次使用时创建；client_mode 可切换为录制/回放/模拟客户端"""
+        if self._client is None:
+            self._client = create_genai_client(self.api_key, self.private_config, PROJECT_ROOT)
+        return self._client
+
+    def _image_bytes(self, image_abs_path: str):
+        """读取要发送的图片字节：启用 upload_transform 时在内存中缩小并重新编码，否则为原始文件"""
+        if self.upload_transform is not None:
+            return self.upload_transform.apply(image_abs_path)
+        mime_type = mimetypes.guess_type(image_abs_path)[0] or 'image/png'
+        with open(image_abs_path, 'rb') as file:
+            return file.read(), mime_type
+
+    def _image_part(self, image_abs_path: str, inline_used: int = 0):
+        """
+        构造请求中的图片部分：小图内联发送字节，请求中内联的总大小超过 inline_max_bytes 时回退为文件上传。
+
+        :param image_abs_path: 图片路径
+        :param inline_used: 同一请求中已内联的字节数
+        :return: (图片部分, 本次内联的字节数)
+        """
+        data, mime_type = self._image_bytes(image_abs_path)
+        if inline_used + len(data) > self.inline_max_bytes:
+            return self.client.files.upload(file=io.BytesIO(data),
+                                            config=types.UploadFileConfig(mime_type=mime_type)), 0
+        return types.Part.from_bytes(data=data, mime_type=mime_type), len(data)
+
+    async def _image_part_async(self, image_abs_path: str, inline_used: int = 0):
+        """_image_part 的协程版本，解码与重新编码在线程中执行，文件上传使用异步客户端"""
+        data, mime_type = await asyncio.to_thread(self._image_bytes, image_abs_path)
+        if inline_used + len(data) > self.inline_max_bytes:
+            return await self.client.aio.files.upload(file=io.BytesIO(data),
+                                                      config=types.UploadFileConfig(mime_type=mime_type)), 0
+        return types.Part.from_bytes(data=data, mime_type=mime_type), len(data)
+
     def tag_image(self, image_abs_path: str) -> any:
-        model = self.private_config['model']
-        prompt = self.config['common_tagging_prompt']
-        client = genai.Client(api_key=self.api_key)
-        my_file = client.files.upload(file=image_abs_path)
-
-        response = client.models.generate_content(
-            model=model,
-            contents=[my_file, prompt],
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=[self._image_part(image_abs_path)[0], self.prompt],
         )
         res = response.text if response is not None else ""
         return res
 
+    async def tag_image_async(self, image_abs_path: str) -> any:
+        """使用 genai 的异步客户端 (client.aio) 标记单张图片"""
+        part, _ = await self._image_part_async(image_abs_path)
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=[part, self.prompt],
+        )
+        return response.text if response is not None else ""
+
+    def _multi_prompt(self, count: int) -> list:
+        """批量请求开头的提示词部分"""
+        return [self.prompt, BATCH_PROMPT_TEMPLATE.format(count=count, last=count - 1)]
+
+    def tag_images_multi(self, image_abs_paths: list[str]) -> dict[int, str]:
+        """
+        将多个图标打包为一次请求，要求模型返回以图标序号为键的JSON。
+
+        :param image_abs_paths: 图片路径列表
+        :return: 序号到原始关键词字符串的映射，只包含通过校验的条目
+        """
+        contents = self._multi_prompt(len(image_abs_paths))
+        inline_used = 0
+        for index, image_abs_path in enumerate(image_abs_paths):
+            part, inline_size = self._image_part(image_abs_path, inline_used)
+            inline_used += inline_size
+            contents.extend([f"Icon {index}:", part])
+
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=contents,
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
+        )
+        return self._parse_multi_response(response.text if response is not None else "", len(image_abs_paths))
+
+    async def tag_images_multi_async(self, image_abs_paths: list[str]) -> dict[int, str]:
+        """tag_images_multi 的协程版本"""
+        contents = self._multi_prompt(len(image_abs_paths))
+        inline_used = 0
+        for index, image_abs_path in enumerate(image_abs_paths):
+            part, inline_size = await self._image_part_async(image_abs_path, inline_used)
+            inline_used += inline_size
+            contents.extend([f"Icon {index}:", part])
+
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=contents,
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
+        )
+        return self._parse_multi_response(response.text if response is not None else "", len(image_abs_paths))
+
+    @staticmethod
+    def _parse_multi_response(text: str, count: int) -> dict[int, str]:
+        """解析并校验批量响应，丢弃序号越界或内容为空的条目；无法解析时返回空字典"""
+        try:
+            data = json.loads(text)
+        except (TypeError, json.JSONDecodeError):
+            print(f"  批量响应不是合法的JSON: {str(text)[:100]}")
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        raw_tags = {}
+        for key, value in data.items():
+            try:
+                index = int(key)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(value, list):
+                value = ",".join(str(item) for item in value)
+            if 0 <= index < count and isinstance(value, str) and value.strip():
+                raw_tags[index] = value
+        return raw_tags
+
+    def tag_images_batch(self, image_paths: list[str], batch_size: int = None) -> dict[str, list[str]]:
+        """
+        批量模式：每 batch_size 个图标合并为一次请求；响应解析失败或缺少的图标逐张回退为单图请求。
+        请求本身失败（网络错误、5xx、密钥不可用）时直接抛出，由调用方（如 AsyncTagScheduler）重新排队或隔离密钥。
+        """
+        batch_size = batch_size or self.batch_size
+        if batch_size <= 1:
+            return super().tag_images_batch(image_paths)
+
+        results = {}
+        for start in range(0, len(image_paths), batch_size):
+            chunk = image_paths[start:start + batch_size]
+            raw_tags = self._call_with_rate_limit(self.tag_images_multi, chunk)
+            missing = self._collect_multi_results(chunk, raw_tags, results)
+            if missing:
+                results.update(super().tag_images_batch(missing))
+        return results
+
+    async def tag_images_batch_async(self, image_paths: list[str], batch_size: int = None) -> dict[str, list[str]]:
+        """tag_images_batch 的协程版本"""
+        batch_size = batch_size or self.batch_size
+        if batch_size <= 1:
+            return await super().tag_images_batch_async(image_paths)
+
+        results = {}
+        for start in range(0, len(image_paths), batch_size):
+            chunk = image_paths[start:start + batch_size]
+            raw_tags = await self._call_with_rate_limit_async(self.tag_images_multi_async, chunk)
+            missing = self._collect_multi_results(chunk, raw_tags, results)
+            if missing:
+                results.update(await super().tag_images_batch_async(missing))
+        return results
+
+    def _collect_multi_results(self, chunk: list[str], raw_tags: dict[int, str], results: dict) -> list[str]:
+        """将批量响应写入 results，返回需要逐张回退的图片路径"""
+        for index, image_path in enumerate(chunk):
+            if index in raw_tags:
+                self._store_response(image_path, raw_tags[index])
+                results[image_path] = self.postprocess_tags(raw_tags[index])
+        missing = [image_path for index, image_path in enumerate(chunk) if index not in raw_tags]
+        if missing:
+            print(f"  {len(missing)} 个图标未从批量响应中取得标签，逐张回退")
+        return missing
+
     def postprocess_tags(self, raw_tags: any) -> list[str]:
         """
         标签后处理方法。子类可以重写此方法以实现特定的后处理逻辑。
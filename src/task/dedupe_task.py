@@ -0,0 +1,103 @@
+import json
+import os
+from typing import Dict, List
+
+from PIL import Image
+
+from src.utils.config_holder import get_config_holder
+from src.utils.file_util import get_file_util
+from src.utils.image_prefetcher import ImagePrefetcher
+from src.utils.image_scanner import ScannedImage, scan_images
+from src.utils.perceptual_hash import BKTree, compute_hashes, load_hash_array
+
+
+class DedupeTask:
+    """
+    感知哈希去重任务，在爬取之后、分类之前运行。
+
+    同一个图标常以不同文件名出现在多个合集与关键词的爬取结果中。
+    任务为每张图片计算感知哈希，用BK树查找汉明距离不超过 max_distance 的已保留图片，
+    输出规范图片集合（canonical set）以及 重复图片 -> 规范图片 的映射，
+    后续的分类与标记只处理规范图片。
+    """
+
+    def __init__(self, config: dict, file_util):
+        """
+        :param config: 应用配置，读取 dedupe、crawler.compressed_output_dir 与 common.image_pattern
+        :param file_util: 文件工具
+        """
+        dedupe_config = config.get('dedupe', {})
+        self.images_path = file_util.project_root + config['crawler']['compressed_output_dir']
+        self.image_pattern = config['common']['image_pattern']
+        self.recursive_scan = config['common'].get('recursive_scan', False)
+        self.method = dedupe_config.get('method', 'phash')
+        self.hash_size = dedupe_config.get('hash_size', 8)
+        self.max_distance = dedupe_config.get('max_distance', 4)
+        self.batch_size = dedupe_config.get('batch_size', 256)
+        self.prefetch_workers = dedupe_config.get('prefetch_workers', 4)
+        self.canonical_set_path = file_util.get_absolute_path(
+            dedupe_config.get('canonical_set_path', 'data/processed/canonical_images.json'))
+        self.duplicates_map_path = file_util.get_absolute_path(
+            dedupe_config.get('duplicates_map_path', 'data/processed/duplicates_map.json'))
+
+    def _load(self, image: ScannedImage):
+        """在预取线程中读取图片尺寸（只读图片头）并解码哈希所需的灰度图"""
+        with Image.open(image.path) as img:
+            area = img.width * img.height
+        return load_hash_array(image.path, self.method, self.hash_size), area
+
+    def _iter_hashes(self, images: List[ScannedImage]):
+        """后台线程预取解码灰度图，凑满一批后向量化计算哈希，产出 (规范图片优先级, 文件名, 哈希)"""
+        prefetcher = ImagePrefetcher(images, self._load, num_workers=self.prefetch_workers,
+                                     max_prefetch=self.batch_size)
+        batch_ranks, batch_arrays = [], []
+        for image, loaded, error in prefetcher:
+            if error is not None:
+                print(f"计算感知哈希失败 {image.relpath}: {error}")
+                continue
+            gray, area = loaded
+            # 分辨率优先，其次文件大小，最后按文件名保证结果稳定
+            batch_ranks.append((-area, -image.size, image.relpath))
+            batch_arrays.append(gray)
+            if len(batch_arrays) >= self.batch_size:
+                for rank, hash_value in zip(batch_ranks, compute_hashes(batch_arrays, self.method, self.hash_size)):
+                    yield rank, rank[2], hash_value
+                batch_ranks, batch_arrays = [], []
+        for rank, hash_value in zip(batch_ranks, compute_hashes(batch_arrays, self.method, self.hash_size)):
+            yield rank, rank[2], hash_value
+
+    def do_dedupe(self) -> List[str]:
+        """
+        执行去重并写出规范图片集合与重复映射。
+
+        :return: 规范图片文件名列表
+        """
+        images = list(scan_images(self.images_path, recursive=self.recursive_scan, extensions=None,
+                                  pattern=self.image_pattern))
+        print(f"感知哈希去重: {len(images)} 个图片, 方法: {self.method}, 最大汉明距离: {self.max_distance}")
+        # 先计算全部哈希，再按优先级排序插入BK树，分辨率最高的图片优先成为规范图片
+        hashes = sorted(self._iter_hashes(images))
+        tree = BKTree()
+        canonical: List[str] = []
+        duplicates: Dict[str, str] = {}
+        for _, item, hash_value in hashes:
+            matches = tree.search(hash_value, self.max_distance)
+            if matches:
+                duplicates[item] = matches[0][1]
+            else:
+                tree.add(hash_value, item)
+                canonical.append(item)
+
+        for path, data in ((self.canonical_set_path, canonical), (self.duplicates_map_path, duplicates)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                json.dump(data, file, indent=4)
+        print(f"去重完成: 保留 {len(canonical)} 个图片, 重复 {len(duplicates)} 个")
+        return canonical
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+    file_util = get_file_util(project_root=project_root)
+    config_holder = get_config_holder(env='dev', config_dir=project_root + os.sep + "config")
+    DedupeTask(config_holder.get_config('application'), file_util).do_dedupe()
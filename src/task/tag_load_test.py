@@ -0,0 +1,170 @@
+"""
+远程标签调度的离线压测工具。
+
+使用 genai_stub 的模拟（或回放）客户端代替真实API，按配置的延迟、错误率与服务端RPM限制运行 AsyncTagScheduler，
+报告吞吐量（图片/秒）、请求端到端延迟的 p50/p99（含限流等待与重试）以及配额利用率，
+用于在不消耗真实配额的情况下调整 batch_size、max_in_flight_per_key、rpm 等参数。
+
+示例：
+    python -m src.task.tag_load_test --synthetic 200 --keys 3 --rpm 60 --latency-ms 500 --max-in-flight 4
+"""
+import argparse
+import asyncio
+import copy
+import os
+import tempfile
+import time
+from itertools import islice
+
+import numpy as np
+from PIL import Image
+from rich.console import Console
+from rich.table import Table
+
+from src.tagger.genai_stub import stub_stats
+from src.tagger.googleai_tagger import GoogleAITagger
+from src.task.tag_scheduler import AsyncTagScheduler
+from src.utils.config_holder import get_config_holder
+from src.utils.file_util import get_file_util
+from src.utils.image_scanner import scan_images
+from src.utils.upload_transform import get_upload_transform
+
+def _create_synthetic_images(count: int, image_dir: str) -> list:
+    """生成随机小图标作为压测输入"""
+    rng = np.random.default_rng(0)
+    image_paths = []
+    for i in range(count):
+        image_path = os.path.join(image_dir, f"icon_{i:05d}.png")
+        Image.fromarray(rng.integers(0, 255, (64, 64, 3), dtype=np.uint8)).save(image_path)
+        image_paths.append(image_path)
+    return image_paths
+
+
+def run_load_test(config: dict, image_paths: list, api_keys: list) -> dict:
+    """
+    使用模拟客户端运行一次调度并统计指标。
+
+    :param config: 应用配置（google_ai 的 client_mode 应为 fake 或 replay）
+    :param image_paths: 图片路径列表
+    :param api_keys: 模拟使用的API key列表
+    :return: 压测报告字典
+    """
+    google_ai_config = config['tagger']['providers']['google_ai']
+    request_latencies = []
+
+    def tagger_factory(api_key):
+        tagger = GoogleAITagger(config, api_key)
+        tag_batch = tagger.final_process_images_batch_async
+
+        async def timed_tag_batch(paths, batch_size=None):
+            start = time.perf_counter()
+            try:
+                return await tag_batch(paths, batch_size)
+            finally:
+                request_latencies.append(time.perf_counter() - start)
+
+        tagger.final_process_images_batch_async = timed_tag_batch
+        return tagger
+
+    scheduler = AsyncTagScheduler(tagger_factory, api_keys,
+                                  max_in_flight_per_key=google_ai_config.get('max_in_flight_per_key', 4),
+                                  quarantine_sec=google_ai_config.get('quarantine_sec', 600),
+                                  max_attempts=google_ai_config.get('max_attempts', 3))
+    stub_stats.reset()
+    start = time.perf_counter()
+    results = asyncio.run(scheduler.run(image_paths))
+    elapsed = time.perf_counter() - start
+
+    upload_transform = get_upload_transform(google_ai_config.get('upload_transform'))
+    rpm = google_ai_config.get('rpm')
+    # 令牌桶初始是满的，短时间压测的利用率可能超过100%
+    quota_requests = rpm * len(api_keys) * elapsed / 60 if rpm else None
+    latencies = np.array(request_latencies) if request_latencies else np.zeros(1)
+    api_latencies = np.array(stub_stats.latencies) if stub_stats.latencies else np.zeros(1)
+    return {
+        "images": len(image_paths),
+        "tagged": len(results),
+        "elapsed_sec": elapsed,
+        "images_per_sec": len(results) / elapsed if elapsed > 0 else 0.0,
+        "request_p50": float(np.percentile(latencies, 50)),
+        "request_p99": float(np.percentile(latencies, 99)),
+        "api_p50": float(np.percentile(api_latencies, 50)),
+        "api_p99": float(np.percentile(api_latencies, 99)),
+        "accepted_requests": stub_stats.accepted,
+        "rate_limited": stub_stats.rate_limited,
+        "server_errors": stub_stats.server_errors,
+        "auth_failed": stub_stats.auth_failed,
+        "replay_hits": stub_stats.replay_hits,
+        "replay_misses": stub_stats.replay_misses,
+        "quota_utilization": stub_stats.accepted / quota_requests if quota_requests else None,
+        "upload_transform": upload_transform.summary() if upload_transform is not None else None,
+    }
+
+
+def print_report(report: dict, console: Console = None):
+    """以表格形式打印压测报告"""
+    console = console or Console()
+    table = Table(title=f"标签调度压测 ({report['tagged']}/{report['images']} 张图片)")
+    table.add_column("指标")
+    table.add_column("数值", justify="right")
+    table.add_row("总耗时", f"{report['elapsed_sec']:.2f}s")
+    table.add_row("吞吐量", f"{report['images_per_sec']:.2f} 图片/秒")
+    table.add_row("请求延迟 p50 / p99（含限流等待与重试）",
+                  f"{report['request_p50'] * 1000:.0f}ms / {report['request_p99'] * 1000:.0f}ms")
+    table.add_row("API延迟 p50 / p99", f"{report['api_p50'] * 1000:.0f}ms / {report['api_p99'] * 1000:.0f}ms")
+    table.add_row("成功请求数", str(report['accepted_requests']))
+    table.add_row("429 / 服务端错误 / 鉴权失败",
+                  f"{report['rate_limited']} / {report['server_errors']} / {report['auth_failed']}")
+    if report['replay_hits'] or report['replay_misses']:
+        table.add_row("回放命中 / 未命中", f"{report['replay_hits']} / {report['replay_misses']}")
+    if report['quota_utilization'] is not None:
+        table.add_row("配额利用率 (成功请求 / rpm×key数×时长)", f"{report['quota_utilization']:.1%}")
+    if report['upload_transform'] is not None:
+        table.add_row("上传压缩", report['upload_transform'])
+    console.print(table)
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+    file_util = get_file_util(project_root=project_root)
+    config_holder = get_config_holder(env='dev', config_dir=project_root + os.sep + "config")
+    app_config = copy.deepcopy(config_holder.get_config('application'))
+    google_ai = app_config['tagger']['providers']['google_ai']
+    stub = google_ai.setdefault('stub', {})
+
+    parser = argparse.ArgumentParser(description='远程标签调度离线压测（不消耗真实配额）')
+    parser.add_argument('--image-dir', type=str, help='压测图片目录，默认使用分类器的正例输出目录')
+    parser.add_argument('--synthetic', type=int, help='生成指定数量的随机图片代替真实图片')
+    parser.add_argument('--limit', type=int, default=500, help='最多使用的图片数量')
+    parser.add_argument('--replay', action='store_true', help='回放 record_path 中录制的真实响应')
+    parser.add_argument('--keys', type=int, default=len(google_ai['api_key']), help='模拟的API key数量')
+    parser.add_argument('--rpm', type=int, default=google_ai.get('rpm'), help='客户端限流的每key每分钟请求数')
+    parser.add_argument('--server-rpm', type=int, default=stub.get('rpm_limit'), help='模拟服务端每key每分钟上限')
+    parser.add_argument('--latency-ms', type=float, default=stub.get('latency_ms', 800))
+    parser.add_argument('--jitter-ms', type=float, default=stub.get('latency_jitter_ms', 300))
+    parser.add_argument('--error-rate', type=float, default=stub.get('error_rate', 0.0))
+    parser.add_argument('--max-in-flight', type=int, default=google_ai.get('max_in_flight_per_key', 4))
+    parser.add_argument('--batch-size', type=int, default=google_ai.get('batch_size', 1))
+    args = parser.parse_args()
+
+    google_ai.update({
+        "client_mode": "replay" if args.replay else "fake",
+        "rpm": args.rpm,
+        "max_in_flight_per_key": args.max_in_flight,
+        "batch_size": args.batch_size,
+    })
+    stub.update({"rpm_limit": args.server_rpm, "latency_ms": args.latency_ms,
+                 "latency_jitter_ms": args.jitter_ms, "error_rate": args.error_rate})
+    # 压测不读写响应缓存，保证每张图片都经过调度
+    app_config['tagger']['response_cache'] = {"enabled": False}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.synthetic:
+            paths = _create_synthetic_images(args.synthetic, tmp_dir)
+        else:
+            image_dir = args.image_dir or file_util.get_absolute_path(
+                app_config['classifier']['classified_out_dir_positive'])
+            paths = [image.path for image in islice(scan_images(image_dir), args.limit)]
+        print(f"压测 {len(paths)} 张图片, {args.keys} 个key, rpm={args.rpm}, 并发={args.max_in_flight}, "
+              f"batch_size={args.batch_size}")
+        print_report(run_load_test(app_config, paths, [f"stub-key-{i}" for i in range(args.keys)]))
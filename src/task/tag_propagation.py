@@ -0,0 +1,111 @@
+import os
+from typing import Callable, Dict, List
+
+from src.tagger.clip_tagger import ClipTagger
+from src.utils.embedding_index import EmbeddingIndex
+
+
+class TagPropagator:
+    """
+    基于图像嵌入最近邻的标签传播。
+
+    爬取的图标集中有大量近似变体（换色、不同尺寸），对每个变体都调用一次远程API是浪费。
+    传播器用CLIP图像嵌入（读写与CLIP标签器共用的嵌入缓存）检索已标记的图片：
+    相似度超过阈值的图片直接复用或合并近邻的标签，只有真正新的图标才交给远程标签器。
+    """
+
+    def __init__(self, config: dict):
+        """
+        :param config: 应用配置，读取 tagger.propagation 与 tagger.providers.clip
+        """
+        propagation_config = config['tagger'].get('propagation', {})
+        self.threshold = propagation_config.get('threshold', 0.95)
+        self.mode = propagation_config.get('mode', 'copy')
+        self.top_k = propagation_config.get('top_k', 3)
+        if self.mode not in ('copy', 'merge'):
+            raise ValueError(f"未知的标签传播模式: {self.mode}")
+        self.config = config
+        # 待传播的图片结果键 -> [(近邻结果键, 相似度), ...]
+        self.propagated: Dict[str, List[tuple]] = {}
+
+    def _iter_embeddings(self, image_paths: List[str]):
+        """使用CLIP标签器的分析器流式计算图像嵌入"""
+        embedder = ClipTagger(self.config)
+        embedder.load_model()
+        batch_size = embedder.private_config.get('batch_size', 16)
+        try:
+            for image_path, image_embeds, _ in embedder.analyzer.iter_image_embeddings(image_paths, batch_size):
+                yield image_path, image_embeds[0].cpu().numpy()
+        finally:
+            embedder.flush()
+
+    def plan(self, image_files: List[str], results: Dict[str, List[str]],
+             key_fn: Callable[[str], str] = os.path.basename) -> List[str]:
+        """
+        找出需要调用远程标签器的新图标。
+
+        初始索引只包含 image_files 中已有标签的图片，不包含标签结果中其他目录或已删除的图片
+        （标签结果只记录文件名，无法找回其原图计算嵌入）。未标记的图片按顺序检索，相似度达到阈值的记为待传播，
+        否则视为新图标并加入索引，使同一批次中后续的变体也能复用它的标签。
+
+        :param image_files: 图片路径列表
+        :param results: 已有的标签结果（结果键 -> 标签列表）
+        :param key_fn: 图片路径到结果键的映射，默认为文件名；递归扫描时使用相对路径
+        :return: 需要远程标记的图片路径列表
+        """
+        self.propagated = {}
+        tagged_files = [path for path in image_files if results.get(key_fn(path))]
+        untagged_files = [path for path in image_files if not results.get(key_fn(path))]
+        if not untagged_files:
+            return []
+
+        print(f"计算 {len(image_files)} 个图片的嵌入用于标签传播")
+        embeddings = dict(self._iter_embeddings(tagged_files + untagged_files))
+        index = EmbeddingIndex()
+        for path in tagged_files:
+            if path in embeddings:
+                index.add(key_fn(path), embeddings[path])
+
+        novel_files = []
+        for path in untagged_files:
+            filename = key_fn(path)
+            if path not in embeddings:
+                # 无法计算嵌入的图片交给远程标签器处理
+                novel_files.append(path)
+                continue
+            neighbours = index.search(embeddings[path], k=self.top_k, min_score=self.threshold)
+            if neighbours:
+                self.propagated[filename] = neighbours
+            else:
+                novel_files.append(path)
+                index.add(filename, embeddings[path])
+
+        print(f"标签传播: {len(self.propagated)} 个图片复用近邻标签, {len(novel_files)} 个新图标需要远程标记")
+        return novel_files
+
+    def resolve(self, results: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """
+        远程标记完成后，将近邻的标签写入待传播的图片。
+
+        copy 模式复用最相似且已有标签的近邻；merge 模式按相似度顺序合并全部近邻的标签。
+
+        :param results: 标签结果，会被原地更新
+        :return: 本次传播得到的 文件名 -> 标签列表
+        """
+        propagated_tags = {}
+        for filename, neighbours in self.propagated.items():
+            tags = []
+            for neighbour, _ in neighbours:
+                neighbour_tags = results.get(neighbour)
+                if not neighbour_tags:
+                    continue
+                if self.mode == 'copy':
+                    tags = list(neighbour_tags)
+                    break
+                tags.extend(tag for tag in neighbour_tags if tag not in tags)
+            if tags:
+                propagated_tags[filename] = tags
+            else:
+                print(f"  近邻均未成功标记，跳过传播: {filename}")
+        results.update(propagated_tags)
+        return propagated_tags
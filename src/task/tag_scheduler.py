@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List
+
+from src.tagger.base_tagger import ApiKeyUnavailableError, BaseTagger
+
+
+class _KeyState:
+    """单个API key的标签器与健康状态"""
+
+    def __init__(self, index: int, tagger: BaseTagger):
+        self.index = index
+        self.tagger = tagger
+        self.quarantined_until = 0.0
+        self.disabled = False
+
+
+class AsyncTagScheduler:
+    """
+    远程标签器的异步调度器（共享工作队列）。
+
+    全部请求放入同一个队列，每个API key由 max_in_flight_per_key 个协程从队列中取请求并发执行，
+    快的key自然多做，不会因为某个key被限流而拖慢整体。
+    key鉴权失败时永久停用，配额用尽（限流重试耗尽）时隔离 quarantine_sec 秒，
+    其请求重新放回队列交给其他健康的key；请求中标记失败的图片最多重试 max_attempts 次。
+    """
+
+    def __init__(self, tagger_factory: Callable[[str], BaseTagger], api_keys: List[str],
+                 max_in_flight_per_key: int = 4, on_result: Callable[[Dict[str, List[str]]], None] = None,
+                 quarantine_sec: float = 600, max_attempts: int = 3):
+        """
+        :param tagger_factory: 根据API key创建标签器的函数
+        :param api_keys: API key列表
+        :param max_in_flight_per_key: 每个key同时在途的最大请求数
+        :param on_result: 每个请求完成后以 {图片路径: 标签列表} 调用的回调
+        :param quarantine_sec: 配额用尽的key被隔离的秒数
+        :param max_attempts: 每张图片最多尝试的次数
+        """
+        self.tagger_factory = tagger_factory
+        self.api_keys = api_keys
+        self.max_in_flight_per_key = max(1, max_in_flight_per_key)
+        self.on_result = on_result
+        self.quarantine_sec = quarantine_sec
+        self.max_attempts = max(1, max_attempts)
+        # 最近一次 run 中各key的状态（是否停用、隔离截止时间），供调用方检查
+        self.key_states: List[_KeyState] = []
+
+    async def _worker(self, key: _KeyState, queue: asyncio.Queue, results: Dict[str, List[str]]):
+        """从共享队列中取出请求执行；key被隔离时等待，被停用时退出"""
+        while not key.disabled:
+            wait = key.quarantined_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            request_files, attempt = await queue.get()
+            try:
+                if key.disabled or key.quarantined_until > time.monotonic():
+                    # 等待期间该key已被其他协程隔离，把请求留给健康的key
+                    queue.put_nowait((request_files, attempt))
+                    continue
+                await self._run_request(key, queue, request_files, attempt, results)
+            finally:
+                queue.task_done()
+
+    async def _run_request(self, key: _KeyState, queue: asyncio.Queue, request_files: List[str], attempt: int,
+                           results: Dict[str, List[str]]):
+        try:
+            request_tags = await key.tagger.final_process_images_batch_async(request_files)
+        except ApiKeyUnavailableError as e:
+            # 请求不计入失败次数，放回队列交给其他key
+            queue.put_nowait((request_files, attempt))
+            if e.permanent:
+                key.disabled = True
+                print(f"key {key.index} 已停用: {str(e)}")
+            elif key.quarantined_until <= time.monotonic():
+                key.quarantined_until = time.monotonic() + self.quarantine_sec
+                print(f"key {key.index} 隔离 {self.quarantine_sec}s: {str(e)}")
+            return
+        except Exception as e:
+            print(f"  标记失败: {str(e)}")
+            request_tags = {}
+
+        for image_path, tags in request_tags.items():
+            print(f"  {os.path.basename(image_path)} 标签: {', '.join(tags)}")
+        results.update(request_tags)
+        if request_tags and self.on_result is not None:
+            self.on_result(request_tags)
+
+        failed_files = [path for path in request_files if path not in request_tags]
+        if failed_files and attempt + 1 < self.max_attempts:
+            print(f"  {len(failed_files)} 个图片标记失败，重新排队（第 {attempt + 2} 次尝试）")
+            queue.put_nowait((failed_files, attempt + 1))
+
+    async def run(self, image_files: List[str]) -> Dict[str, List[str]]:
+        """
+        为全部图片贴标签。
+
+        :param image_files: 图片路径列表
+        :return: 图片路径到标签列表的映射；失败的图片不包含在内
+        """
+        results = {}
+        if not image_files:
+            return results
+        keys = [_KeyState(i, self.tagger_factory(api_key)) for i, api_key in enumerate(self.api_keys)]
+        self.key_states = keys
+        # 每个请求包含 tagger.batch_size 张图片（不支持批量的标签器为1张）
+        request_size = max(1, getattr(keys[0].tagger, 'batch_size', 1))
+        queue = asyncio.Queue()
+        for start in range(0, len(image_files), request_size):
+            queue.put_nowait((image_files[start:start + request_size], 0))
+        print(f"共享队列: {queue.qsize()} 个请求, {len(keys)} 个key, 每个key并发数 {self.max_in_flight_per_key}")
+
+        workers = [asyncio.create_task(self._worker(key, queue, results))
+                   for key in keys for _ in range(self.max_in_flight_per_key)]
+        join_task = asyncio.create_task(queue.join())
+        all_workers = asyncio.gather(*workers)
+        # 队列处理完，或全部key都已停用（工作协程全部退出）时结束
+        await asyncio.wait([join_task, all_workers], return_when=asyncio.FIRST_COMPLETED)
+        if not join_task.done():
+            print(f"全部key均不可用，剩余 {queue.qsize()} 个请求未处理")
+            join_task.cancel()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(all_workers, return_exceptions=True)
+        return results
@@ -1,20 +1,52 @@
 import asyncio
 import glob
 import importlib
-import json
-import math
+import multiprocessing
 import os
-import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import partial
 from typing import Dict, List, Type
 
 from src.tagger.base_tagger import BaseTagger
 from src.tagger.googleai_tagger import GoogleAITagger
+from src.task.tag_propagation import TagPropagator
+from src.task.tag_scheduler import AsyncTagScheduler
 from src.utils.config_holder import get_config_holder
 from src.utils.file_util import get_file_util
+from src.utils.image_scanner import list_image_paths
+from src.utils.tag_store import TagJournalStore
+
+# 多进程工作进程内的标签器实例，每个进程只初始化一次
+_worker_tagger = None
+
+
+def _init_local_tagger_worker(tagger_class, tagger_config, intra_op_threads):
+    """
+    工作进程初始化函数：限制torch线程数并加载一次本地模型标签器。
+    """
+    global _worker_tagger
+    if intra_op_threads:
+        os.environ['OMP_NUM_THREADS'] = str(intra_op_threads)
+        try:
+            import torch
+            torch.set_num_threads(intra_op_threads)
+        except ImportError:
+            pass
+    _worker_tagger = tagger_class(tagger_config)
+    _worker_tagger.load_model()
+
+
+def _tag_image_shard(image_paths: List[str]) -> Dict[str, List[str]]:
+    """
+    在工作进程中为一组图片贴标签。
+
+    :param image_paths: 图片路径列表
+    :return: 图片路径到标签列表的映射
+    """
+    shard_results = _worker_tagger.final_process_images_batch(image_paths)
+    _worker_tagger.flush()
+    return shard_results
 
-lock = threading.Lock()
 
 def rename_images_with_tags(image_tags: Dict[str, List[str]], max_tags: int = 5) -> Dict[str, str]:
     """
@@ -140,21 +172,16 @@ class TagTask:
         
         :return: 图片文件的绝对路径列表
         """
-        # 支持的图片文件扩展名
-        image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.webp']
-        image_files = []
-        
-        # 检查目录是否存在
-        if not os.path.exists(self.input_image_dir):
-            print(f"警告: 输入图片目录不存在: {self.input_image_dir}")
-            return []
-            
-        # 搜索所有支持的图片文件
-        for ext in image_extensions:
-            pattern = os.path.join(self.input_image_dir, ext)
-            image_files.extend(glob.glob(pattern))
-            
-        return image_files
+        # 单次遍历目录，扩展名不区分大小写；common.recursive_scan 为 true 时包含子目录
+        recursive = self.config_holder.get_value("application", "common.recursive_scan", False)
+        return list_image_paths(self.input_image_dir, recursive=recursive)
+
+    def _result_key(self, image_path: str) -> str:
+        """
+        标签结果的键：相对输入目录的路径（以 / 分隔）。
+        非递归扫描时即为文件名，与已有结果兼容；递归扫描时不同子目录中的同名文件互不冲突。
+        """
+        return os.path.relpath(image_path, self.input_image_dir).replace(os.sep, '/')
 
     def create_tagger_instance(self, tagger_name: str = None) -> BaseTagger:
         """
@@ -172,6 +199,51 @@ class TagTask:
         tagger_class = self.taggers[tagger_name]
         return tagger_class(self.tagger_config)
 
+    def tag_images_with_process_pool(self, image_files: List[str], store: TagJournalStore) -> Dict[str, List[str]]:
+        """
+        使用进程池为图片贴标签，适用于本地模型标签器。
+
+        每个工作进程通过初始化函数只加载一次模型，父进程按分片分发图片路径，
+        并在每个分片完成时把结果追加到标签存储。
+
+        :param image_files: 图片文件路径列表
+        :param store: 标签结果存储，已有结果会被跳过
+        :return: 更新后的标签结果
+        """
+        tagger_class = self.taggers[self.current_tagger_name]
+        private_config = self.tagger_config['tagger']['providers'][self.current_tagger_name]
+        num_workers = private_config.get('num_workers', os.cpu_count() or 1)
+        intra_op_threads = private_config.get('intra_op_threads', 1)
+        shard_size = private_config.get('shard_size', 64)
+
+        results = store.entries
+        pending_files = [path for path in image_files if not results.get(self._result_key(path))]
+        print(f"待标记 {len(pending_files)} 个图片, 进程数: {num_workers}, 分片大小: {shard_size}")
+        shards = [pending_files[i:i + shard_size] for i in range(0, len(pending_files), shard_size)]
+
+        def merge_shard(shard_results):
+            store.update({self._result_key(path): tags for path, tags in shard_results.items()})
+            print(f"======保存一批{len(shard_results)}个数据======")
+
+        if num_workers <= 1:
+            _init_local_tagger_worker(tagger_class, self.tagger_config, None)
+            for shard in shards:
+                merge_shard(_tag_image_shard(shard))
+            return results
+
+        # 使用spawn启动，避免在已加载torch线程池的进程上fork
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                                 initializer=_init_local_tagger_worker,
+                                 initargs=(tagger_class, self.tagger_config, intra_op_threads)) as executor:
+            futures = [executor.submit(_tag_image_shard, shard) for shard in shards]
+            for future in as_completed(futures):
+                try:
+                    merge_shard(future.result())
+                except Exception as e:
+                    print(f"  分片标记失败: {str(e)}")
+        return results
+
     def tag_images(self) -> Dict[str, List[str]]:
         """
         为所有图片贴标签。
@@ -187,63 +259,60 @@ class TagTask:
         print(f"找到 {len(image_files)} 个图片文件")
         
 
-        image_tag_json_dict_path = file_util.project_root + self.tagger_config['tagger']['image_tag_dict_path']
-        os.makedirs(os.path.dirname(image_tag_json_dict_path), exist_ok=True)
-        # 检查文件是否存在，如果不存在则创建一个空的.json文件
-        if not os.path.exists(image_tag_json_dict_path):
-            with open(image_tag_json_dict_path, 'w') as file:
-                json.dump({}, file)  # 创建一个空的JSON对象并写入文件
-
-        # 为每个图片贴标签
-        results = self.file_util.read_dict_from_json(image_tag_json_dict_path)
-
-        def split_list_into_n_groups(lst, n):
-            group_size = math.ceil(len(lst) / n)
-            return [lst[i:i + group_size] for i in range(0, len(lst), group_size)]
-        batch_size = 20
-        def process_group(image_files, api_key):
-            tagger =  GoogleAITagger(self.tagger_config, api_key)
-            batch = {}
-            for i, image_path in enumerate(image_files):
-                print(f"处理图片 {i + 1}/{len(image_files)}: {os.path.basename(image_path)}")
-                filename = os.path.basename(image_path)
-
-                def save_batch():
-                    with lock:
-                        results.update(batch)
-                        with open(image_tag_json_dict_path, 'w') as file:
-                            json.dump(results, file, indent=4)
-                        print(f"======保存一批{len(batch)}个数据======")
-                        batch.clear()
-
-                if filename in results and results[filename]:
-                    if i+1 >= len(image_files):
-                        save_batch()
-                    continue
-                try:
-                    tags = tagger.final_process_image_tagging(image_path)
-                    batch[filename] = tags
-                    if len(batch) >= batch_size or i+1 >= len(image_files):
-                        save_batch()
-                    print(f"  标签: {', '.join(tags)}")
-                except Exception as e:
-                    print(f"  标记失败: {str(e)}")
-
-        async def run():
-            api_key_list = self.tagger_config['tagger']['providers']['google_ai']['api_key']
-            groups = split_list_into_n_groups(image_files, len(api_key_list))
-            with ThreadPoolExecutor(max_workers=len(api_key_list)) as executor:
-                loop = asyncio.get_event_loop()
-                tasks = [
-                    loop.run_in_executor(
-                        executor,
-                        partial(process_group, group, api_key_list[i])
-                    )
-                    for i, group in enumerate(groups)
-                ]
-                await asyncio.gather(*tasks)
-
-        asyncio.run(run())
+        image_tag_json_dict_path = self.file_util.project_root + self.tagger_config['tagger']['image_tag_dict_path']
+        # 每个结果追加写入日志，定期压缩回 JSON 文件；结束时导出完整的 JSON 字典
+        store = TagJournalStore(image_tag_json_dict_path,
+                                self.tagger_config['tagger'].get('journal_compact_min_entries', 5000))
+        try:
+            return self._tag_images_into(image_files, store)
+        finally:
+            store.close()
+
+    def _tag_images_into(self, image_files: List[str], store: TagJournalStore) -> Dict[str, List[str]]:
+        """为图片贴标签并把结果写入 store，返回全部标签结果"""
+        results = store.entries
+
+        # 本地模型标签器使用进程池并行
+        tagger_class = self.taggers.get(self.current_tagger_name)
+        if tagger_class is not None and tagger_class.runs_locally:
+            self.tag_images_with_process_pool(image_files, store)
+            print(f"======任务结束，最终标记成功{len(results)}个图片")
+            return results
+
+        # 远程标签器：先通过嵌入近邻传播复用已有标签，只把新图标发送给API
+        propagator = None
+        if self.config_holder.get_value("application", "tagger.propagation.enabled", False):
+            propagator = TagPropagator(self.tagger_config)
+            image_files = propagator.plan(image_files, results, self._result_key)
+
+        def on_result(request_tags):
+            store.update({self._result_key(path): tags for path, tags in request_tags.items()})
+
+        # 所有API key从共享队列取请求，每个key有 max_in_flight_per_key 个请求同时在途，配额由按key共享的限流器控制
+        google_ai_config = self.tagger_config['tagger']['providers']['google_ai']
+        scheduler = AsyncTagScheduler(
+            partial(GoogleAITagger, self.tagger_config),
+            google_ai_config['api_key'],
+            max_in_flight_per_key=google_ai_config.get('max_in_flight_per_key', 4),
+            on_result=on_result,
+            quarantine_sec=google_ai_config.get('quarantine_sec', 600),
+            max_attempts=google_ai_config.get('max_attempts', 3))
+        if self.config_holder.get_value("application", "tagger.response_cache.revalidate", False):
+            # 已标记的图片也经过响应缓存校验：缓存命中不产生请求，提示词或模型变化后重新标记
+            pending_files = image_files
+        else:
+            pending_files = [path for path in image_files if not results.get(self._result_key(path))]
+        asyncio.run(scheduler.run(pending_files))
+        stats_tagger = GoogleAITagger(self.tagger_config)
+        cache_stats = stats_tagger.response_cache_stats()
+        if cache_stats is not None:
+            print(f"======响应缓存: 命中{cache_stats['hits']}次, 未命中{cache_stats['misses']}次======")
+        if stats_tagger.upload_transform is not None:
+            print(f"======上传压缩: {stats_tagger.upload_transform.summary()}======")
+        if propagator is not None:
+            propagated_tags = propagator.resolve(results)
+            store.update(propagated_tags)
+            print(f"======通过标签传播标记{len(propagated_tags)}个图片======")
         print(f"======任务结束，最终标记成功{len(results)}个图片")
         return results
 
@@ -48,15 +48,26 @@ class TaskListFlow:
         asyncio.run(run())
 
 
+    def dedupe_images(self):
+        """感知哈希去重任务，未启用时返回None"""
+        if not self.config_holder.get_value("application", "dedupe.enabled", False):
+            return None
+        from src.task.dedupe_task import DedupeTask
+
+        return DedupeTask(self.config_holder.get_config('application'), self.file_util).do_dedupe()
+
     def classify_images(self):
         """分类图像任务"""
         from src.classifier.cnn_fine_tuned_classifier import CNNFineTunedClassifier
-        
+
+        # 先去重，重复的图片不再分类和标记
+        canonical_items = self.dedupe_images()
+
         # 创建分类器实例
         classifier = CNNFineTunedClassifier(self.config_holder.get_config('application'), self.file_util)
         
         # 执行分类
-        classifier.do_classify()
+        classifier.do_classify(canonical_items)
 
     def tag_images(self, image_folder_path=None):
         """为图像添加标签任务"""
@@ -0,0 +1,123 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+
+class HashedArrayStore:
+    """
+    以内容哈希为键的磁盘数组存储。
+
+    数据按分片保存：每个分片是一个 .npy 文件（行 = 一个数组）加一个同名 .keys.json 索引文件。
+    分片只追加、写入后不再修改，读取时以内存映射方式打开，多个进程可以安全地同时读写同一目录。
+    """
+
+    def __init__(self, store_dir: str, shard_size: int = 4096):
+        """
+        初始化存储，并加载目录中已有的全部分片索引。
+
+        :param store_dir: 存储目录
+        :param shard_size: 缓冲多少条新数组后写出一个分片
+        """
+        self.store_dir = store_dir
+        self.shard_size = shard_size
+        self._index = {}
+        self._shards = {}
+        self._pending_keys = []
+        self._pending_arrays = []
+        self._lock = threading.RLock()
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._load_index()
+        atexit.register(self.flush)
+
+    def _load_index(self):
+        """扫描目录中的分片索引文件，建立 键 -> (分片名, 行号) 映射"""
+        for filename in sorted(os.listdir(self.store_dir)):
+            if not filename.endswith('.keys.json'):
+                continue
+            shard_name = filename[:-len('.keys.json')]
+            if not os.path.exists(self._shard_path(shard_name)):
+                continue
+            try:
+                with open(os.path.join(self.store_dir, filename), 'r') as file:
+                    keys = json.load(file)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"跳过损坏的分片索引 {filename}: {e}")
+                continue
+            for row, key in enumerate(keys):
+                self._index[key] = (shard_name, row)
+
+    def _shard_path(self, shard_name: str) -> str:
+        return os.path.join(self.store_dir, shard_name + '.npy')
+
+    def _open_shard(self, shard_name: str) -> np.ndarray:
+        shard = self._shards.get(shard_name)
+        if shard is None:
+            shard = np.load(self._shard_path(shard_name), mmap_mode='r')
+            self._shards[shard_name] = shard
+        return shard
+
+    def get(self, key: str):
+        """
+        读取键对应的数组。
+
+        :param key: 内容哈希
+        :return: 数组副本，不存在时返回 None
+        """
+        with self._lock:
+            location = self._index.get(key)
+            if location is None:
+                return None
+            shard_name, row = location
+            if shard_name is None:
+                return self._pending_arrays[row].copy()
+            return np.array(self._open_shard(shard_name)[row])
+
+    def put(self, key: str, array: np.ndarray):
+        """
+        写入一个数组。数组先缓冲在内存中，累计到 shard_size 条时写出新分片。
+
+        :param key: 内容哈希
+        :param array: 数组，同一存储中的数组形状和类型应保持一致
+        """
+        with self._lock:
+            if key in self._index:
+                return
+            self._index[key] = (None, len(self._pending_arrays))
+            self._pending_keys.append(key)
+            self._pending_arrays.append(np.asarray(array))
+            if len(self._pending_arrays) >= self.shard_size:
+                self.flush()
+
+    def flush(self):
+        """将缓冲中的数组写出为一个新分片"""
+        with self._lock:
+            if not self._pending_arrays:
+                return
+            shard_name = f"shard-{int(time.time())}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            shard_path = self._shard_path(shard_name)
+            keys_path = os.path.join(self.store_dir, shard_name + '.keys.json')
+
+            # 先写数据再写索引，索引文件存在即代表分片完整
+            tmp_path = shard_path + '.tmp'
+            with open(tmp_path, 'wb') as file:
+                np.save(file, np.stack(self._pending_arrays))
+            os.replace(tmp_path, shard_path)
+            with open(keys_path + '.tmp', 'w') as file:
+                json.dump(self._pending_keys, file)
+            os.replace(keys_path + '.tmp', keys_path)
+
+            for row, key in enumerate(self._pending_keys):
+                self._index[key] = (shard_name, row)
+            self._pending_keys = []
+            self._pending_arrays = []
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
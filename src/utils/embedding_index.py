@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    用 argpartition 选出分数最高的 k 个下标，只对这 k 个结果排序。
+
+    :param scores: 一维分数数组
+    :param k: 返回的最大条数
+    :return: 按分数降序排列的下标数组
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class EmbeddingIndex:
+    """
+    内存中的向量最近邻索引（暴力检索）。
+
+    向量写入时做L2归一化，检索时以一次矩阵乘法计算余弦相似度，
+    再用 argpartition 选出 top-k，适合几万到几十万条图标嵌入的规模。
+    """
+
+    def __init__(self, dim: int = None, capacity: int = 1024):
+        """
+        :param dim: 向量维度，为None时由第一次写入的向量决定
+        :param capacity: 初始容量，写满后按倍数扩容
+        """
+        self.dim = dim
+        self.keys = []
+        self._key_rows = {}
+        self._matrix = None if dim is None else np.zeros((capacity, dim), dtype=np.float32)
+        self._capacity = capacity
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, key: str, vector: np.ndarray):
+        """
+        写入一条向量，键已存在时覆盖原向量。
+
+        :param key: 向量对应的键（如图片文件名）
+        :param vector: 形状为 (D,) 或 (1, D) 的向量
+        """
+        vector = self._normalize(vector)[0]
+        if self._matrix is None:
+            self.dim = vector.shape[0]
+            self._matrix = np.zeros((self._capacity, self.dim), dtype=np.float32)
+        row = self._key_rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row >= self._matrix.shape[0]:
+                grown = np.zeros((self._matrix.shape[0] * 2, self.dim), dtype=np.float32)
+                grown[:row] = self._matrix[:row]
+                self._matrix = grown
+            self.keys.append(key)
+            self._key_rows[key] = row
+        self._matrix[row] = vector
+
+    def search(self, query: np.ndarray, k: int = 5, min_score: float = None) -> list:
+        """
+        检索与查询向量最相似的 k 条记录。
+
+        :param query: 形状为 (D,) 或 (1, D) 的查询向量
+        :param k: 返回的最大条数
+        :param min_score: 相似度下限，低于该值的记录不返回
+        :return: 按相似度降序排列的 (键, 余弦相似度) 列表
+        """
+        count = len(self.keys)
+        if count == 0 or k <= 0:
+            return []
+        scores = self._matrix[:count] @ self._normalize(query)[0]
+        return [(self.keys[row], float(scores[row])) for row in top_k_indices(scores, k)
+                if min_score is None or scores[row] >= min_score]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._key_rows
+
+    def __len__(self) -> int:
+        return len(self.keys)
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 
@@ -81,6 +82,24 @@ class FileUtil:
         return os.path.join(self.get_project_root(), path)
 
 
+def compute_file_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    计算文件内容哈希，用作内容寻址缓存的键。
+
+    :param file_path: 文件路径
+    :param chunk_size: 每次读取的字节数
+    :return: 十六进制哈希字符串
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
 # 工厂函数，用于从Metaflow步骤中获取FileUtil实例
 def get_file_util(project_root=None) -> FileUtil:
     """
@@ -0,0 +1,76 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+def load_image_fast(image_path: str, target_size: tuple = None, exact: bool = False,
+                    resample=Image.BICUBIC) -> Image.Image:
+    """
+    快速解码图像为RGB，并利用PIL的 draft / reduce 做低成本缩小。
+
+    draft 让JPEG解码器直接以 1/2、1/4、1/8 的比例解码；reduce 对其他格式做整数倍快速缩小。
+    两者都保证缩小后的尺寸不小于 target_size。
+
+    :param image_path: 图像文件路径
+    :param target_size: 目标尺寸 (宽, 高)，为None时按原尺寸解码
+    :param exact: 为True时最终精确缩放到 target_size，否则只做不低于目标尺寸的快速缩小
+    :param resample: 精确缩放使用的重采样方法
+    :return: RGB模式的PIL图像
+    """
+    with Image.open(image_path) as img:
+        if target_size is not None:
+            img.draft('RGB', target_size)
+        img = img.convert('RGB')
+
+    if target_size is not None:
+        factor = min(img.width // target_size[0], img.height // target_size[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        if exact and img.size != tuple(target_size):
+            img = img.resize(tuple(target_size), resample)
+    return img
+
+
+class ImagePrefetcher:
+    """
+    有界预取流水线：后台线程池提前执行图像的读取、解码与预处理，
+    主线程按输入顺序逐个取出结果并运行模型，使I/O、解码与推理相互重叠。
+    """
+
+    def __init__(self, items, load_fn, num_workers: int = 4, max_prefetch: int = 16):
+        """
+        :param items: 待处理的条目（通常为图像路径），可以是生成器，按需逐个取出
+        :param load_fn: 在后台线程中执行的加载函数，输入一个条目，返回预处理结果
+        :param num_workers: 后台线程数
+        :param max_prefetch: 最多提前准备的条目数量，限制内存占用
+        """
+        self.items = items
+        self.load_fn = load_fn
+        self.num_workers = max(1, num_workers)
+        self.max_prefetch = max(1, max_prefetch)
+
+    def __iter__(self):
+        """
+        按输入顺序产出 (条目, 结果, 异常)。加载失败时结果为None，异常为捕获到的异常。
+        """
+        items = iter(self.items)
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            pending = deque()
+            while True:
+                while not exhausted and len(pending) < self.max_prefetch:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append((item, executor.submit(self.load_fn, item)))
+                if not pending:
+                    break
+
+                item, future = pending.popleft()
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
@@ -0,0 +1,84 @@
+import os
+import re
+from typing import Iterator, NamedTuple, Tuple
+
+# 默认识别的图片扩展名（不区分大小写）
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+
+class ScannedImage(NamedTuple):
+    """扫描到的图片：绝对路径、相对扫描根目录的路径（也用作续扫游标）、文件大小与修改时间"""
+    path: str
+    relpath: str
+    size: int
+    mtime: float
+
+
+def _parts(relpath: str) -> Tuple[str, ...]:
+    return tuple(relpath.replace('\\', '/').split('/'))
+
+
+def scan_images(root: str, recursive: bool = False, extensions=IMAGE_EXTENSIONS, pattern: str = None,
+                after: str = None) -> Iterator[ScannedImage]:
+    """
+    用 os.scandir 单次遍历目录，按需逐个产出图片。
+
+    每个目录只读取一次，条目按文件名排序，子目录在其名称位置展开，
+    因此遍历顺序等价于按路径分段排序的顺序，可以用上次产出的 relpath 作为游标续扫；
+    游标之前的子目录整个跳过，不会再次读取。只对匹配的文件调用 stat，且复用 scandir 已取得的信息。
+
+    :param root: 扫描根目录
+    :param recursive: 是否递归子目录
+    :param extensions: 匹配的扩展名（不区分大小写），为None时不按扩展名过滤
+    :param pattern: 可选的文件名正则（不区分大小写），如 common.image_pattern
+    :param after: 续扫游标，只产出 relpath 排在其后的图片
+    :return: ScannedImage 迭代器
+    """
+    if not os.path.isdir(root):
+        print(f"警告: 图片目录不存在: {root}")
+        return
+    extensions = tuple(ext.lower() for ext in extensions) if extensions else None
+    name_regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+    cursor = _parts(after) if after else None
+    yield from _scan_dir(root, (), recursive, extensions, name_regex, cursor)
+
+
+def _scan_dir(directory: str, prefix: tuple, recursive: bool, extensions, name_regex,
+              cursor) -> Iterator[ScannedImage]:
+    try:
+        with os.scandir(directory) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+    except OSError as e:
+        print(f"无法读取目录 {directory}: {e}")
+        return
+
+    for entry in entries:
+        parts = prefix + (entry.name,)
+        if cursor is not None and parts < cursor[:len(parts)]:
+            # 游标之前的条目（及其全部子条目）已处理过
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    yield from _scan_dir(entry.path, parts, recursive, extensions, name_regex, cursor)
+                continue
+            if not entry.is_file():
+                continue
+        except OSError:
+            continue
+        if cursor is not None and parts <= cursor:
+            continue
+        if extensions is not None and not entry.name.lower().endswith(extensions):
+            continue
+        if name_regex is not None and not name_regex.search(entry.name):
+            continue
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        yield ScannedImage(entry.path, "/".join(parts), stat.st_size, stat.st_mtime)
+
+
+def list_image_paths(root: str, recursive: bool = False, extensions=IMAGE_EXTENSIONS, pattern: str = None) -> list:
+    """scan_images 的便捷版本，返回图片绝对路径列表"""
+    return [image.path for image in scan_images(root, recursive, extensions, pattern)]
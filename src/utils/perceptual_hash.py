@@ -0,0 +1,148 @@
+import numpy as np
+from PIL import Image
+
+from src.utils.image_prefetcher import load_image_fast
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """n×n 的正交DCT-II变换矩阵"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def _pack_bits(bits: np.ndarray) -> list:
+    """将 (N, hash_size*hash_size) 的布尔矩阵按行打包为Python整数"""
+    packed = np.packbits(bits.astype(np.uint8), axis=1)
+    return [int.from_bytes(row.tobytes(), 'big') for row in packed]
+
+
+def dhash_arrays(gray: np.ndarray) -> list:
+    """
+    批量计算差值哈希 (dHash)：比较每行相邻像素的亮度。
+
+    :param gray: 形状为 (N, hash_size, hash_size + 1) 的灰度数组
+    :return: N 个整数哈希
+    """
+    gray = np.asarray(gray, dtype=np.float32)
+    bits = gray[:, :, 1:] > gray[:, :, :-1]
+    return _pack_bits(bits.reshape(len(gray), -1))
+
+
+def phash_arrays(gray: np.ndarray, hash_size: int = 8) -> list:
+    """
+    批量计算感知哈希 (pHash)：对灰度图做二维DCT，取左上角低频系数与其中位数比较。
+
+    :param gray: 形状为 (N, S, S) 的灰度数组，S 通常为 hash_size 的4倍
+    :param hash_size: 哈希边长，哈希位数为 hash_size * hash_size
+    :return: N 个整数哈希
+    """
+    gray = np.asarray(gray, dtype=np.float32)
+    dct = _dct_matrix(gray.shape[1])
+    coefficients = np.einsum('ij,njk,lk->nil', dct, gray, dct)[:, :hash_size, :hash_size]
+    coefficients = coefficients.reshape(len(gray), -1)
+    median = np.median(coefficients, axis=1, keepdims=True)
+    return _pack_bits(coefficients > median)
+
+
+def load_hash_array(image_path: str, method: str = 'phash', hash_size: int = 8) -> np.ndarray:
+    """
+    读取图像并缩放为计算哈希所需的灰度数组。
+
+    :param image_path: 图像文件路径
+    :param method: 'phash' 或 'dhash'
+    :param hash_size: 哈希边长
+    :return: 灰度数组，pHash 为 (4s, 4s)，dHash 为 (s, s + 1)
+    """
+    if method == 'phash':
+        size = (hash_size * 4, hash_size * 4)
+    elif method == 'dhash':
+        size = (hash_size + 1, hash_size)
+    else:
+        raise ValueError(f"未知的感知哈希方法: {method}")
+    image = load_image_fast(image_path, target_size=size, exact=True, resample=Image.LANCZOS)
+    return np.asarray(image.convert('L'), dtype=np.float32)
+
+
+def compute_hashes(gray_arrays: list, method: str = 'phash', hash_size: int = 8) -> list:
+    """
+    对一批由 load_hash_array 得到的灰度数组做向量化哈希计算。
+
+    :param gray_arrays: 灰度数组列表
+    :param method: 'phash' 或 'dhash'
+    :param hash_size: 哈希边长
+    :return: 整数哈希列表
+    """
+    if not gray_arrays:
+        return []
+    stacked = np.stack(gray_arrays)
+    if method == 'phash':
+        return phash_arrays(stacked, hash_size)
+    return dhash_arrays(stacked)
+
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    """两个整数哈希的汉明距离"""
+    return bin(hash_a ^ hash_b).count('1')
+
+
+class BKTree:
+    """
+    基于汉明距离的BK树，用于查找给定距离半径内的所有哈希。
+
+    每个节点的子节点按与该节点的距离分桶，查询时利用三角不等式只访问
+    距离在 [d - radius, d + radius] 范围内的子树。
+    """
+
+    def __init__(self):
+        # 节点结构: [哈希, 条目, {距离: 子节点}]
+        self._root = None
+        self._size = 0
+
+    def add(self, hash_value: int, item):
+        """
+        插入一个哈希及其对应的条目。
+
+        :param hash_value: 整数哈希
+        :param item: 关联的条目（如文件名）
+        """
+        self._size += 1
+        if self._root is None:
+            self._root = [hash_value, item, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, item, {}]
+                return
+            node = child
+
+    def search(self, hash_value: int, radius: int) -> list:
+        """
+        查找与给定哈希的汉明距离不超过 radius 的全部条目。
+
+        :param hash_value: 整数哈希
+        :param radius: 最大汉明距离
+        :return: 按距离升序排列的 (距离, 条目) 列表
+        """
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= radius:
+                matches.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def __len__(self) -> int:
+        return self._size
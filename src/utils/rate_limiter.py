@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+
+class _TokenBucket:
+    """令牌桶：容量为 capacity，每秒补充 rate 个令牌"""
+
+    def __init__(self, capacity: float, period_sec: float):
+        self.capacity = capacity
+        self.rate = capacity / period_sec
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """距离下一个令牌可用还需等待的秒数"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    按分钟和按天限制请求数的令牌桶限流器，线程安全。
+
+    与固定的 sleep 不同，限流器只在令牌不足时等待所需的最短时间，请求本身的耗时也计入配额窗口；
+    收到429等限流响应时调用 penalize 暂停全部使用者一段时间。
+    """
+
+    def __init__(self, rpm: int = None, rpd: int = None):
+        """
+        :param rpm: 每分钟最大请求数，为None时不限制
+        :param rpd: 每天最大请求数，为None时不限制
+        """
+        self.minute_bucket = _TokenBucket(rpm, 60) if rpm else None
+        self.day_bucket = _TokenBucket(rpd, 86400) if rpd else None
+        self.buckets = [bucket for bucket in (self.minute_bucket, self.day_bucket) if bucket is not None]
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> float:
+        """尝试消耗一个令牌，成功返回0，否则返回还需等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            for bucket in self.buckets:
+                bucket.refill(now)
+            wait = max([self._blocked_until - now] + [bucket.wait_time() for bucket in self.buckets])
+            if wait <= 0:
+                for bucket in self.buckets:
+                    bucket.tokens -= 1
+                return 0.0
+            return wait
+
+    def acquire(self) -> float:
+        """
+        阻塞直到可以发出一次请求，并消耗一个令牌。
+
+        :return: 实际等待的秒数
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self) -> float:
+        """acquire 的协程版本，等待期间不阻塞事件循环"""
+        waited = 0.0
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def penalize(self, delay_sec: float):
+        """
+        收到限流响应后，在 delay_sec 秒内阻止所有请求，并清空分钟桶中剩余的令牌。
+
+        :param delay_sec: 暂停的秒数
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay_sec)
+            if self.minute_bucket is not None:
+                self.minute_bucket.tokens = min(self.minute_bucket.tokens, 0)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key: str, rpm: int = None, rpd: int = None) -> RateLimiter:
+    """
+    获取键（如API key）对应的限流器，同一个键在进程内共享同一个实例。
+
+    :param key: 限流键
+    :param rpm: 每分钟最大请求数
+    :param rpd: 每天最大请求数
+    :return: 限流器
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(rpm=rpm, rpd=rpd)
+            _limiters[key] = limiter
+        return limiter
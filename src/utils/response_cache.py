@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class ResponseCache:
+    """
+    远程API响应的磁盘缓存，以字符串为键、JSON可序列化的值为内容。
+
+    每个写入方（进程）追加写自己的 .jsonl 文件，文件名包含时间、进程号与随机串，
+    多个进程可以安全地同时写入同一目录；初始化时加载目录中全部文件，后写入的记录覆盖先写入的。
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        :param cache_dir: 缓存目录
+        """
+        self.cache_dir = cache_dir
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries = {}
+        self._file = None
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        for filename in sorted(os.listdir(self.cache_dir)):
+            if not filename.endswith('.jsonl'):
+                continue
+            with open(os.path.join(self.cache_dir, filename), 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 写入中断留下的不完整行
+                        continue
+                    self._entries[record["key"]] = record["value"]
+
+    def get(self, key: str):
+        """
+        读取缓存并计数命中/未命中。
+
+        :param key: 缓存键
+        :return: 缓存的值，不存在时返回None
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            self.stats["hits" if value is not None else "misses"] += 1
+            return value
+
+    def put(self, key: str, value):
+        """
+        写入缓存，立即追加到本进程的缓存文件。
+
+        :param key: 缓存键
+        :param value: JSON可序列化的值
+        """
+        with self._lock:
+            if self._entries.get(key) == value:
+                return
+            self._entries[key] = value
+            if self._file is None:
+                filename = f"responses-{int(time.time())}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+                self._file = open(os.path.join(self.cache_dir, filename), 'a', encoding='utf-8')
+            self._file.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(cache_dir: str) -> ResponseCache:
+    """获取目录对应的响应缓存，同一目录在进程内共享同一个实例"""
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = ResponseCache(cache_dir)
+            _caches[cache_dir] = cache
+        return cache
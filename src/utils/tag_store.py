@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+from typing import Dict, List
+
+
+def _journal_path(json_path: str) -> str:
+    return json_path + ".journal.jsonl"
+
+
+def _read_snapshot(json_path: str) -> Dict[str, List[str]]:
+    if not os.path.exists(json_path):
+        return {}
+    with open(json_path, 'r', encoding='utf-8') as file:
+        try:
+            return json.load(file)
+        except json.JSONDecodeError:
+            print(f"Error: The file {json_path} is not a valid JSON file.")
+            return {}
+
+
+def _replay_journal(journal_path: str, entries: Dict[str, List[str]]) -> int:
+    """把日志中的记录按顺序应用到 entries，返回有效记录数"""
+    if not os.path.exists(journal_path):
+        return 0
+    count = 0
+    with open(journal_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 写入中断留下的不完整行
+                continue
+            entries[record["name"]] = record["tags"]
+            count += 1
+    return count
+
+
+def load_tag_dict(json_path: str) -> Dict[str, List[str]]:
+    """
+    只读地加载标签结果：JSON快照加上尚未合并的日志记录，运行中的标记任务写入的结果也能读到。
+
+    :param json_path: 标签结果JSON文件路径（tagger.image_tag_dict_path）
+    :return: 图片文件名到标签列表的映射
+    """
+    entries = _read_snapshot(json_path)
+    _replay_journal(_journal_path(json_path), entries)
+    return entries
+
+
+class TagJournalStore:
+    """
+    标签结果的追加写存储。
+
+    每标记完成一张图片就向日志文件（<json_path>.journal.jsonl）追加一行，写入开销与已有结果的数量无关；
+    日志记录数达到上次压缩时快照中的记录数（且不少于 compact_min_entries）时压缩：把全部结果原子地写回原有格式的 JSON 文件并清空日志，
+    总写入量随结果数线性增长。关闭时总会压缩一次，因此其他模块仍可直接读取 JSON 文件。
+    中断后重新打开时回放日志恢复结果，压缩过程中中断也不会丢失数据（回放是幂等的）。
+    """
+
+    def __init__(self, json_path: str, compact_min_entries: int = 5000):
+        """
+        :param json_path: 标签结果JSON文件路径
+        :param compact_min_entries: 触发压缩的最少日志记录数
+        """
+        self.json_path = json_path
+        self.journal_path = _journal_path(json_path)
+        self.compact_min_entries = compact_min_entries
+        self.entries = _read_snapshot(json_path)
+        # 上次压缩后快照中的记录数，日志记录数超过它时再次压缩
+        self.snapshot_entries = len(self.entries)
+        self.journal_entries = _replay_journal(self.journal_path, self.entries)
+        self._lock = threading.Lock()
+        self._journal = None
+        os.makedirs(os.path.dirname(json_path) or '.', exist_ok=True)
+        if self.journal_entries:
+            print(f"从日志恢复 {self.journal_entries} 条标签记录")
+
+    def update(self, tags: Dict[str, List[str]]):
+        """
+        记录一批标签结果：追加到日志并刷新到磁盘。
+
+        :param tags: 图片文件名到标签列表的映射
+        """
+        if not tags:
+            return
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+                if self._journal.tell() > 0:
+                    # 上次中断可能留下不完整的行，换行后再追加
+                    self._journal.write("\n")
+            self._journal.write("".join(json.dumps({"name": name, "tags": image_tags}, ensure_ascii=False) + "\n"
+                                        for name, image_tags in tags.items()))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self.entries.update(tags)
+            self.journal_entries += len(tags)
+            if self.journal_entries >= max(self.compact_min_entries, self.snapshot_entries):
+                self._compact()
+
+    def _compact(self):
+        self.export(self.json_path)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        # 快照已包含全部记录，清空日志
+        open(self.journal_path, 'w').close()
+        self.snapshot_entries = len(self.entries)
+        self.journal_entries = 0
+
+    def compact(self):
+        """把日志合并进JSON快照"""
+        with self._lock:
+            self._compact()
+
+    def export(self, path: str):
+        """
+        以原有的JSON字典格式导出全部结果（先写临时文件再原子替换）。
+
+        :param path: 导出路径
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def close(self):
+        """压缩日志并关闭文件"""
+        self.compact()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,92 @@
+import io
+import os
+
+from PIL import Image
+
+from src.utils.file_util import compute_file_hash
+from src.utils.image_prefetcher import load_image_fast
+
+# 缩略图长边与短边之比的上限，超长图像的短边会小于 size
+MAX_ASPECT_RATIO = 4
+
+
+class ThumbnailCache:
+    """
+    保持宽高比的缩略图缓存，供分类器与标签器共享。
+
+    每张图像只从原图解码一次，等比缩小到短边为 size（不放大小图，长边不超过 size × MAX_ASPECT_RATIO），
+    以无损PNG按图像内容哈希存放。保持宽高比使CLIP的"短边缩放+中心裁剪"与直接读原图时几何一致；
+    分类器从缩略图拉伸到模型输入尺寸，像素与 keras load_img 不完全一致。
+    """
+
+    def __init__(self, cache_dir: str, size: int = 300):
+        """
+        :param cache_dir: 缓存根目录，不同尺寸的缩略图分目录存放
+        :param size: 缩略图短边长度，应不小于各模型的最大输入尺寸
+        """
+        self.size = size
+        self.cache_dir = os.path.join(cache_dir, str(size))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def namespace(self) -> str:
+        """缩略图预处理的标识，用于区分由缩略图与原图计算的嵌入缓存"""
+        return f"thumb{self.size}"
+
+    def _thumbnail_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash[:2], content_hash + ".png")
+
+    def _create_thumbnail(self, image_path: str) -> Image.Image:
+        with Image.open(image_path) as img:
+            width, height = img.size
+        scale = min(self.size / min(width, height), self.size * MAX_ASPECT_RATIO / max(width, height))
+        if scale >= 1:
+            return load_image_fast(image_path)
+        target_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return load_image_fast(image_path, target_size=target_size, exact=True, resample=Image.LANCZOS)
+
+    def get_thumbnail(self, image_path: str, content_hash: str = None) -> Image.Image:
+        """
+        获取图像的缩略图，缓存未命中时从原图生成并写入缓存。
+
+        :param image_path: 原图路径
+        :param content_hash: 预先计算的内容哈希，为None时现场计算
+        :return: RGB缩略图
+        """
+        if content_hash is None:
+            content_hash = compute_file_hash(image_path)
+        thumbnail_path = self._thumbnail_path(content_hash)
+        if os.path.exists(thumbnail_path):
+            try:
+                with Image.open(thumbnail_path) as img:
+                    return img.convert('RGB')
+            except OSError:
+                # 写入中断留下的损坏文件，重新生成
+                pass
+
+        thumbnail = self._create_thumbnail(image_path)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format="PNG")
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        # 先写临时文件再原子替换，多个进程可以同时写同一目录
+        tmp_path = f"{thumbnail_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(buffer.getvalue())
+        os.replace(tmp_path, thumbnail_path)
+        return thumbnail
+
+    def flush(self):
+        """缩略图写入时即落盘，保留该方法以兼容调用方"""
+
+
+def create_thumbnail_cache(common_config: dict, file_util):
+    """
+    根据 common 配置创建缩略图缓存，未配置 thumbnail_cache_dir 时返回None。
+
+    :param common_config: 配置中的 common 节点
+    :param file_util: 文件工具，用于解析相对于项目根目录的路径
+    :return: ThumbnailCache 实例或None
+    """
+    cache_dir = common_config.get('thumbnail_cache_dir')
+    if not cache_dir:
+        return None
+    return ThumbnailCache(file_util.get_absolute_path(cache_dir), size=common_config.get('thumbnail_size', 300))
@@ -0,0 +1,142 @@
+import io
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# 输出格式到 PIL 格式名与 mime 类型的映射
+_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+
+
+class UploadImageTransform:
+    """
+    上传前在内存中缩小并重新编码图片，减少请求体积与延迟。
+
+    最长边超过 max_side 的图片等比缩小，再以 format / quality 编码；
+    重新编码后反而更大（如已经很小的PNG）时保留原始字节。
+    最近变换的结果按路径缓存，重试、批量失败后的逐张回退与重新排队时不再重复解码；
+    统计中每张图片只计一次。线程安全。
+    """
+
+    def __init__(self, max_side: int = 512, format: str = "webp", quality: int = 85, max_cached: int = 256):
+        """
+        :param max_side: 最长边上限（像素）
+        :param format: 输出格式：webp、png 或 jpeg
+        :param quality: webp / jpeg 的编码质量 (1-100)
+        :param max_cached: 内存中缓存的变换结果数量上限
+        """
+        if format.lower() not in _FORMATS:
+            raise ValueError(f"不支持的上传格式: {format}")
+        self.max_side = max_side
+        self.pil_format, self.mime_type = _FORMATS[format.lower()]
+        self.quality = quality
+        self.stats = {"images": 0, "transformed": 0, "original_bytes": 0, "sent_bytes": 0}
+        self.max_cached = max_cached
+        # 路径 -> (文件大小, 修改时间, 字节, mime类型)，按最近使用排序
+        self._cached = OrderedDict()
+        self._counted = set()
+        self._lock = threading.Lock()
+
+    def signature(self) -> str:
+        """变换参数的签名，参数变化时模型看到的输入不同，可用于区分响应缓存"""
+        return f"{self.pil_format.lower()}{self.max_side}q{self.quality}"
+
+    def _encode(self, img: Image.Image) -> bytes:
+        img.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+        if self.pil_format == "JPEG":
+            # JPEG 不支持透明通道，透明区域铺白底
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        buffer = io.BytesIO()
+        if self.pil_format == "PNG":
+            img.save(buffer, format="PNG", optimize=True)
+        else:
+            img.save(buffer, format=self.pil_format, quality=self.quality)
+        return buffer.getvalue()
+
+    def apply(self, image_path: str):
+        """
+        读取并变换图片。
+
+        :param image_path: 图片路径
+        :return: (字节, mime类型)
+        """
+        stat = os.stat(image_path)
+        with self._lock:
+            cached = self._cached.get(image_path)
+            if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime):
+                self._cached.move_to_end(image_path)
+                return cached[2], cached[3]
+
+        with open(image_path, 'rb') as file:
+            original = file.read()
+        mime_type = mimetypes.guess_type(image_path)[0] or 'image/png'
+        try:
+            with Image.open(io.BytesIO(original)) as img:
+                # 动图只取第一帧
+                img.seek(0)
+                data = self._encode(img.copy())
+        except Exception as e:
+            print(f"  上传前变换失败，使用原图 {os.path.basename(image_path)}: {str(e)}")
+            data = None
+
+        transformed = data is not None and len(data) < len(original)
+        if transformed:
+            mime_type = self.mime_type
+        else:
+            data = original
+        with self._lock:
+            self._cached[image_path] = (stat.st_size, stat.st_mtime, data, mime_type)
+            while len(self._cached) > self.max_cached:
+                self._cached.popitem(last=False)
+            if image_path not in self._counted:
+                self._counted.add(image_path)
+                self.stats["images"] += 1
+                self.stats["transformed"] += int(transformed)
+                self.stats["original_bytes"] += len(original)
+                self.stats["sent_bytes"] += len(data)
+        return data, mime_type
+
+    def summary(self) -> str:
+        """统计信息的可读摘要"""
+        original_mb = self.stats["original_bytes"] / 1024 / 1024
+        sent_mb = self.stats["sent_bytes"] / 1024 / 1024
+        saved = 1 - sent_mb / original_mb if original_mb > 0 else 0.0
+        return (f"{self.stats['images']}张图片({self.stats['transformed']}张重新编码), "
+                f"原始{original_mb:.2f}MB -> 发送{sent_mb:.2f}MB, 节省{saved:.1%}")
+
+
+_transforms = {}
+_transforms_lock = threading.Lock()
+
+
+def get_upload_transform(transform_config: dict):
+    """
+    根据配置获取上传变换，参数相同的配置在进程内共享同一个实例（及其统计）。
+
+    :param transform_config: 包含 enabled、max_side、format、quality 的配置
+    :return: UploadImageTransform，未启用时返回None
+    """
+    if not transform_config or not transform_config.get('enabled', False):
+        return None
+    max_side = transform_config.get('max_side', 512)
+    format = transform_config.get('format', 'webp')
+    quality = transform_config.get('quality', 85)
+    with _transforms_lock:
+        key = (max_side, format.lower(), quality)
+        transform = _transforms.get(key)
+        if transform is None:
+            transform = UploadImageTransform(max_side=max_side, format=format, quality=quality)
+            _transforms[key] = transform
+        return transform
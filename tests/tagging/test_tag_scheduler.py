@@ -0,0 +1,73 @@
+"""
+AsyncTagScheduler 的离线测试：使用 genai_stub 的模拟客户端（client_mode: fake），不消耗真实配额。
+"""
+import asyncio
+import copy
+import os
+
+import numpy as np
+from PIL import Image
+
+from src.tagger.genai_stub import stub_stats
+from src.tagger.googleai_tagger import GoogleAITagger
+from src.task.tag_scheduler import AsyncTagScheduler
+from src.utils.config_holder import get_config_holder
+
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+
+
+def _fake_config(auth_fail_keys, error_rate):
+    config = copy.deepcopy(get_config_holder(env='dev', config_dir=root_path + os.sep + "config")
+                           .get_config("application"))
+    config['tagger']['response_cache'] = {"enabled": False}
+    google_ai = config['tagger']['providers']['google_ai']
+    google_ai.update({
+        "client_mode": "fake",
+        "batch_size": 4,
+        "rpm": 60000,
+        "rpd": None,
+        "max_attempts": 8,
+        "stub": {"latency_ms": 5, "latency_jitter_ms": 0, "error_rate": error_rate, "rpm_limit": None,
+                 "auth_fail_keys": auth_fail_keys, "seed": 7},
+    })
+    return config
+
+
+def _create_images(image_dir, count):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(str(image_dir), f"icon_{i:03d}.png")
+        Image.fromarray(rng.integers(0, 255, (32, 32, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_scheduler_tags_all_images_and_disables_invalid_key(tmp_path):
+    config = _fake_config(auth_fail_keys=["scheduler-bad-key"], error_rate=0.2)
+    image_paths = _create_images(tmp_path, 40)
+    api_keys = ["scheduler-key-0", "scheduler-bad-key", "scheduler-key-1"]
+    stub_stats.reset()
+
+    scheduler = AsyncTagScheduler(lambda api_key: GoogleAITagger(config, api_key), api_keys,
+                                  max_in_flight_per_key=3, quarantine_sec=600, max_attempts=8)
+    results = asyncio.run(scheduler.run(image_paths))
+
+    assert set(results) == set(image_paths)
+    assert all(tags for tags in results.values())
+    disabled = [api_keys[key.index] for key in scheduler.key_states if key.disabled]
+    assert disabled == ["scheduler-bad-key"]
+    assert stub_stats.auth_failed >= 1
+    assert stub_stats.server_errors >= 1
+
+
+def test_scheduler_stops_when_all_keys_are_invalid(tmp_path):
+    config = _fake_config(auth_fail_keys=["scheduler-bad-a", "scheduler-bad-b"], error_rate=0.0)
+    image_paths = _create_images(tmp_path, 8)
+    scheduler = AsyncTagScheduler(lambda api_key: GoogleAITagger(config, api_key),
+                                  ["scheduler-bad-a", "scheduler-bad-b"], max_in_flight_per_key=2)
+
+    results = asyncio.run(scheduler.run(image_paths))
+
+    assert results == {}
+    assert all(key.disabled for key in scheduler.key_states)
@@ -0,0 +1,31 @@
+import os
+
+from src.utils.image_scanner import scan_images
+
+
+def _touch(root, relpath):
+    path = os.path.join(str(root), *relpath.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write('x')
+
+
+def test_recursive_scan_matches_extensions_case_insensitively(tmp_path):
+    for relpath in ['a.PNG', 'b.jpg', 'notes.txt', 'x/icon.png', 'y/icon.png', 'y/deep/c.WebP']:
+        _touch(tmp_path, relpath)
+
+    assert [image.relpath for image in scan_images(str(tmp_path))] == ['a.PNG', 'b.jpg']
+    recursive = [image.relpath for image in scan_images(str(tmp_path), recursive=True)]
+    assert recursive == ['a.PNG', 'b.jpg', 'x/icon.png', 'y/deep/c.WebP', 'y/icon.png']
+    assert all(image.size == 1 for image in scan_images(str(tmp_path), recursive=True))
+
+
+def test_resume_from_cursor(tmp_path):
+    for relpath in ['a.png', 'a/x.png', 'a/y.png', 'a.png.d/z.gif', 'b/deep/q.jpeg', 'm.png']:
+        _touch(tmp_path, relpath)
+
+    ordered = [image.relpath for image in scan_images(str(tmp_path), recursive=True)]
+    assert len(ordered) == 6
+    for i, cursor in enumerate(ordered):
+        resumed = [image.relpath for image in scan_images(str(tmp_path), recursive=True, after=cursor)]
+        assert resumed == ordered[i + 1:]
@@ -0,0 +1,58 @@
+import json
+import os
+
+from src.utils.tag_store import TagJournalStore, load_tag_dict
+
+
+def _journal_lines(json_path):
+    journal_path = json_path + ".journal.jsonl"
+    if not os.path.exists(journal_path):
+        return 0
+    with open(journal_path, 'r', encoding='utf-8') as file:
+        return sum(1 for line in file if line.strip())
+
+
+def test_compacts_repeatedly_on_fresh_run(tmp_path):
+    json_path = str(tmp_path / "tags.json")
+    store = TagJournalStore(json_path, compact_min_entries=10)
+    compactions = 0
+    for i in range(10000):
+        before = store.journal_entries
+        store.update({f"icon_{i}.png": ["blue"]})
+        if store.journal_entries < before:
+            compactions += 1
+        # 日志不会超过上次压缩时快照大小（且不少于 compact_min_entries）
+        assert store.journal_entries < max(10, store.snapshot_entries)
+
+    # 快照按倍数增长：10, 20, 40, ... 约 log2(10000/10) 次压缩
+    assert 8 <= compactions <= 12
+    assert _journal_lines(json_path) == store.journal_entries
+    assert len(load_tag_dict(json_path)) == 10000
+
+    store.close()
+    assert _journal_lines(json_path) == 0
+    with open(json_path, 'r', encoding='utf-8') as file:
+        assert len(json.load(file)) == 10000
+
+
+def test_replays_journal_after_crash(tmp_path):
+    json_path = str(tmp_path / "tags.json")
+    with open(json_path, 'w') as file:
+        json.dump({"a.png": ["red"]}, file)
+
+    store = TagJournalStore(json_path, compact_min_entries=1000)
+    store.update({"b.png": ["green"], "a.png": ["red", "round"]})
+    # 模拟进程在写入下一行时中断：留下不完整的行，且没有调用 close()
+    with open(json_path + ".journal.jsonl", 'a', encoding='utf-8') as file:
+        file.write('{"name": "c.png", "ta')
+    del store
+
+    recovered = TagJournalStore(json_path, compact_min_entries=1000)
+    assert recovered.entries == {"a.png": ["red", "round"], "b.png": ["green"]}
+    # 不完整的行之后继续追加，新记录不受影响
+    recovered.update({"d.png": ["gray"]})
+    assert load_tag_dict(json_path)["d.png"] == ["gray"]
+
+    recovered.close()
+    with open(json_path, 'r', encoding='utf-8') as file:
+        assert json.load(file) == {"a.png": ["red", "round"], "b.png": ["green"], "d.png": ["gray"]}